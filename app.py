@@ -1,12 +1,25 @@
 import streamlit as st
 import pandas as pd
-import os
-import re
+import numpy as np
 import pydeck as pdk
-import json
+import threading
+import atexit
+from contextlib import contextmanager
 from datetime import datetime
-from geopy.geocoders import Nominatim
-from geopy.distance import geodesic
+
+from dedupe import choose_keep, find_duplicates, merged_fields, text_block
+from geo import GridIndex, haversine_km
+from geocoding import geocode_zone
+from hours import HoursIndex, hours_fields, local_now
+from leads import LEAD_DEFAULTS, load_leads, sources_signature
+from map_data import CLUSTER_ZOOMS, DEFAULT_COLOR, STATUS_COLORS, build_map_payload, precompute_cells
+from metrics import METRIC_FIELDS, PipelineMetrics, count_leads, funnel, leaderboard
+from profiling import PhaseTimer, TimingLog, records_frame, summarize
+from routing import MAX_ROUTE_STOPS, plan_route
+from schema import STATUS_OPTIONS, SYSTEM_OPTIONS, VENDOR_OPTIONS, contains_mask, make_room
+from search import SEARCH_FIELDS, SearchIndex
+from storage import StaleStoreError, get_storage, save_snapshot
+from writer import WriteBehind
 
 # Helper for layout
 def make_clickable_card(title, value, key):
@@ -91,138 +104,619 @@ def local_css():
     """, unsafe_allow_html=True)
 # ... [Keeping Constants and init_db same] ...
 # Constants
-EXT_DATA = 'google.csv'
-DB_FILE = 'leads_db.csv'
-COLUMN_MAPPING = {
-    'qBF1Pd': "Nombre del Local",
-    'W4Efsd': "Categoría",
-    'MW4etd': "Rating",
-    'UY7F9': "Cantidad de Reseñas",
-    'W4Efsd 4': "Dirección",
-    'W4Efsd 6': "Horario",
-    'ah5Ghc': "Reseña Destacada",
-    'hfpxzc href': "URL",
-    'A1zNzb href': "Website",
-    'J8zHNe': "Tiene_Pedido"
+CHECKLIST_ITEMS = ["Verificar Teléfono", "Enviar Presentación", "Llamada Inicial", "Agendar Visita", "Visita Realizada"]
+DEFAULT_RADIUS_KM = 2.0
+SNAPSHOT_DELAY_S = 30
+ROUTE_COLOR = [220, 0, 180, 220]
+ANY_STAGE = "(cualquiera)"
+HOURS_FILTERS = ["Cualquier horario", "Abierto ahora", "Abre en la próxima hora"]
+DUPLICATES_SHOWN = 20
+
+EDITOR_PAGE_SIZE = 100
+EDITOR_COLUMNS = ["Nombre del Local", "Status", "Sistema", "Asignado_A", "Priority", "Notas", "Dirección",
+                  "Categoría", "Rating", "Horario", "Website", "Tiene_Pedido"]
+EDITOR_COLUMN_CONFIG = {
+    "Status": st.column_config.SelectboxColumn("Status", options=STATUS_OPTIONS, required=True),
+    "Sistema": st.column_config.SelectboxColumn("Sistema", options=SYSTEM_OPTIONS, required=True),
+    "Asignado_A": st.column_config.SelectboxColumn("Asignado_A", options=VENDOR_OPTIONS, required=True),
+    "Priority": st.column_config.NumberColumn("Priority", min_value=0, step=1),
+    "Rating": st.column_config.NumberColumn("Rating", min_value=0.0, max_value=5.0, step=0.1),
 }
 
-STATUS_OPTIONS = ["Por Contactar", "Contactado", "Visitado", "Demo", "Cliente"]
-CHECKLIST_ITEMS = ["Verificar Teléfono", "Enviar Presentación", "Llamada Inicial", "Agendar Visita", "Visita Realizada"]
-SYSTEM_OPTIONS = ["Sin Dato", "Fudo", "Bistrosoft", "BCN", "Otro"]
-VENDOR_OPTIONS = ["Sin Asignar", "Seba", "Facu"]
-
-def extract_coordinates(url):
-    """Extracts latitude and longitude from Google Maps URL."""
-    if not isinstance(url, str):
-        return None, None
-    match = re.search(r'!3d(-?\d+\.\d+)!4d(-?\d+\.\d+)', url)
-    if match:
+@st.cache_resource
+def _db_cache():
+    """Process-wide holder for the loaded leads frame, shared by every rerun and session."""
+    cache = {"signature": None, "df": None, "geo_index": None, "map_cells": None, "search_index": None, "version": 0, "storage": get_storage(), "lock": threading.Lock(), "snapshot_timer": None,
+             "duplicates": None, "metrics": None, "hours_index": None, "sign_lock": threading.Lock()}
+    storage = cache["storage"]
+    def run_batch(ops):
+        with _own_write(cache):
+            storage.run_batch(ops)
+    storage.writer = WriteBehind(run_batch)
+    # A normal shutdown (Ctrl+C, SIGTERM) runs atexit, so edits still queued are written first
+    atexit.register(storage.writer.close)
+    return cache
+
+@st.cache_resource
+def _timing_log():
+    """Process-wide rerun timings; recent ones in memory, all of them in timings.jsonl."""
+    return TimingLog()
+
+def run_timer():
+    """PhaseTimer of the current run. A widget callback may start it before the script
+    body runs, so its storage write is counted in the run it triggers."""
+    if "_run_timer" not in st.session_state:
+        st.session_state._run_timer = PhaseTimer(kind="fragment")
+    return st.session_state._run_timer
+
+def finish_run(timer):
+    st.session_state.pop("_run_timer", None)
+    _timing_log().append(timer.record())
+
+def _reset_spatial(cache):
+    """Drops everything indexed by row position (coordinates, opening hours); rebuilt lazily on next use."""
+    cache["geo_index"] = None
+    cache["map_cells"] = None
+    cache["hours_index"] = None
+
+def _sources_signature(cache):
+    return sources_signature(cache["storage"])
+
+@contextmanager
+def _own_write(cache):
+    """Wraps a write of ours to the store and re-signs the store (not the exports) after it, so
+    init_db doesn't reload for it. If the store had already changed underneath the frame
+    (cli.py wrote it), the old signature is kept and init_db reloads once our writes land."""
+    storage = cache["storage"]
+    with cache["sign_lock"]:
+        before = storage.signature()
         try:
-            return float(match.group(1)), float(match.group(2))
-        except ValueError:
-            return None, None
-    return None, None
+            yield
+        finally:
+            signature = cache["signature"]
+            if signature is not None and signature[0] == before:
+                cache["signature"] = (storage.signature(), signature[1])
+
+def _report(level, message):
+    getattr(st, level)(message)
 
 def init_db():
-    df = None
-    
-    # 1. Load Primary Database (leads_db.csv)
-    if os.path.exists(DB_FILE):
-        try:
-            df = pd.read_csv(DB_FILE)
-        except Exception as e:
-            st.error(f"Error cargando base de datos: {e}")
+    """Returns the leads frame, rebuilding it only when the lead store or a scraper export changed on disk.
 
-    # 2. If no Primary DB, Load from Source (google.csv)
-    if df is None and os.path.exists(EXT_DATA):
-        try:
-            df = pd.read_csv(EXT_DATA, encoding='latin1')
-            df = df.rename(columns=COLUMN_MAPPING)
-        except Exception as e:
-            st.error(f"Error cargando datos de Google: {e}")
-            df = pd.DataFrame(columns=["Nombre del Local", "Status"])
-    elif df is None:
-        df = pd.DataFrame(columns=["Nombre del Local", "Status"])
-
-    # 3. SYNC METADATA: Fill missing/empty info from google.csv into current DB
-    if os.path.exists(EXT_DATA):
-        try:
-            raw_df = pd.read_csv(EXT_DATA, encoding='latin1').rename(columns=COLUMN_MAPPING)
-            for col in ["Website", "URL", "Horario", "Dirección", "Categoría", "Rating", "Tiene_Pedido"]:
-                if col not in df.columns:
-                    df[col] = ""
-                
-                # Update missing values
-                df_indexed = df.set_index("Nombre del Local")
-                source_indexed = raw_df[raw_df["Nombre del Local"].isin(df_indexed.index)].drop_duplicates("Nombre del Local").set_index("Nombre del Local")
-                
-                # Merge logic: if target is empty/nan, take from source
-                df_indexed[col] = df_indexed[col].fillna("").replace("nan", "").astype(str).str.strip()
-                mask = (df_indexed[col] == "") | (df_indexed[col] == "No especificado")
-                
-                # Only update where mask is true and source exists
-                common_indices = df_indexed.index[mask].intersection(source_indexed.index)
-                if not common_indices.empty:
-                    df_indexed.loc[common_indices, col] = source_indexed.loc[common_indices, col]
-                
-                df = df_indexed.reset_index()
-        except Exception as e:
-            st.warning(f"Sincronizando: {e}")
-
-    # 4. FIELD MAINTENANCE: Ensure all CRM columns exist
-    defaults = {
-        "Status": "Por Contactar",
-        "Sistema": "Sin Dato",
-        "Checklist": "{}",
-        "Interaction_Log": "[]",
-        "Asignado_A": "Sin Asignar",
-        "Notas": "",
-        "Priority": 0,
-        "Website": "",
-        "Horario": "",
-        "Dirección": "",
-        "Tiene_Pedido": ""
-    }
-    for col, default in defaults.items():
-        if col not in df.columns:
-            df[col] = default
-        df[col] = df[col].fillna(default)
-
-    # 5. DATA CLEANING & COORDINATES
-    if "Rating" in df.columns:
-        df["Rating"] = df["Rating"].astype(str).str.replace(',', '.', regex=False)
-        df["Rating"] = pd.to_numeric(df["Rating"], errors='coerce').fillna(0)
-
-    if "URL" in df.columns:
-        df["URL"] = df["URL"].fillna("").astype(str)
-        # Extract Lat/Lon from URL
-        coords = df["URL"].apply(extract_coordinates)
-        df["latitude"] = coords.apply(lambda x: x[0])
-        df["longitude"] = coords.apply(lambda x: x[1])
-
-    df["Checklist"] = df["Checklist"].fillna("{}").astype(str)
-    df["Interaction_Log"] = df["Interaction_Log"].fillna("[]").astype(str)
+    The Parquet snapshot is tried first; it is only used if it was written for
+    exactly the current sources (by this app or by a cli.py job).
+    """
+    cache = _db_cache()
+    with cache["lock"]:
+        writer = cache["storage"].writer
+        if cache["df"] is not None and writer is not None and writer.pending():
+            # The store is behind the frame until our queued edits land, not ahead of it
+            return cache["df"]
+        signature = _sources_signature(cache)
+        if cache["df"] is None or cache["signature"] != signature:
+            df, inserted, signature = load_leads(cache["storage"], _report)
+            # Every import is checked for leads that duplicate what it brought in
+            duplicates = find_duplicates(df, only=inserted) if inserted else None
+            cache["df"] = df
+            _reset_spatial(cache)
+            cache["search_index"] = None
+            cache["metrics"] = None
+            cache["duplicates"] = duplicates
+            cache["version"] += 1
+            cache["signature"] = signature
+        return cache["df"]
+
+def _schedule_snapshot(cache):
+    """Rewrites the snapshot once writes have been quiet for SNAPSHOT_DELAY_S, off the script thread."""
+    if cache["snapshot_timer"] is not None:
+        cache["snapshot_timer"].cancel()
+    def refresh():
+        writer = cache["storage"].writer
+        if writer is not None:
+            writer.flush()
+        with cache["lock"]:
+            # A frame that is behind the store (cli.py wrote it) is reloaded, not snapshotted
+            if cache["signature"] == _sources_signature(cache):
+                save_snapshot(cache["df"], cache["signature"])
+    cache["snapshot_timer"] = threading.Timer(SNAPSHOT_DELAY_S, refresh)
+    cache["snapshot_timer"].daemon = True
+    cache["snapshot_timer"].start()
+
+@contextmanager
+def _store_write():
+    """Yields the storage backend under the cache lock; the writes it queues are signed as they land."""
+    cache = _db_cache()
+    with run_timer().phase("store_write"), cache["lock"]:
+        yield cache["storage"]
+        cache["version"] += 1
+        _schedule_snapshot(cache)
+
+def update_lead(df, lead_id, fields):
+    """Applies fields to one lead in memory and persists only that row."""
+    with _store_write() as storage:
+        cache = _db_cache()
+        metrics = cache["metrics"] if any(f in METRIC_FIELDS for f in fields) else None
+        if metrics is not None:
+            metrics.remove(_metric_values(df, lead_id))
+        if "Horario" in fields:
+            fields = {**fields, **hours_fields(fields["Horario"])}
+        make_room(df, fields)
+        for col, val in fields.items():
+            df.at[lead_id, col] = val
+        storage.update_lead(df, lead_id, fields)
+        if metrics is not None:
+            metrics.add(_metric_values(df, lead_id))
+        if "latitude" in fields or "longitude" in fields or "Horario" in fields:
+            _reset_spatial(cache)
+        if cache["search_index"] is not None and any(f in SEARCH_FIELDS for f in fields):
+            cache["search_index"].update(lead_id, [df.at[lead_id, c] for c in SEARCH_FIELDS if c in df.columns])
+
+def insert_lead(df, row):
+    """Adds a lead (with CRM defaults) to the cached frame and the store; returns its lead_id."""
+    with _store_write() as storage:
+        row = {**LEAD_DEFAULTS, **row}
+        if row.get("Horario"):
+            row.update(hours_fields(row["Horario"]))
+        cache = _db_cache()
+        # SQLite inserts right away: drain the queue first, then sign the insert like a batch
+        storage.writer.flush()
+        with _own_write(cache):
+            lead_id = storage.insert_lead(df, row)
+        _reset_spatial(cache)
+        if cache["search_index"] is not None:
+            cache["search_index"].add(lead_id, [df.at[lead_id, c] for c in SEARCH_FIELDS if c in df.columns])
+        if cache["metrics"] is not None:
+            cache["metrics"].add(_metric_values(df, lead_id))
+    check_new_duplicates(df, lead_id)
+    return lead_id
+
+def check_new_duplicates(df, lead_id):
+    """Adds the pairs a new lead forms to the pending duplicates, scored outside the cache lock.
+    A lead without coordinates is compared with the leads the search index says share a name
+    or address word with it; only if the index isn't built yet, with the whole frame."""
+    cache = _db_cache()
+    candidates = None
+    if "latitude" in df.columns and (pd.isna(df.at[lead_id, "latitude"]) or pd.isna(df.at[lead_id, "longitude"])):
+        with cache["lock"]:
+            if cache["search_index"] is not None:
+                candidates = text_block(cache["search_index"], df.at[lead_id, "Nombre del Local"], df.at[lead_id, "Dirección"])
+    found = find_duplicates(df, only=[lead_id], text_candidates=candidates)
+    if len(found):
+        with cache["lock"]:
+            known = cache["duplicates"]
+            cache["duplicates"] = found if known is None else pd.concat([found, known], ignore_index=True)
+
+def delete_lead(df, lead_id):
+    """Removes a lead from the cached frame and the store."""
+    with _store_write() as storage:
+        cache = _db_cache()
+        if cache["metrics"] is not None:
+            cache["metrics"].remove(_metric_values(df, lead_id))
+        df.drop(index=lead_id, inplace=True)
+        storage.delete_lead(df, lead_id)
+        _reset_spatial(cache)
+        if cache["search_index"] is not None:
+            cache["search_index"].remove(lead_id)
+        dismiss_duplicate(lead_id)
+
+def merge_leads(df, keep_id, drop_id):
+    """Folds drop_id into keep_id: keep's blanks are filled from drop, drop's notes and
+    checklist move over, and drop is deleted."""
+    with _store_write() as storage:
+        cache = _db_cache()
+        metrics = cache["metrics"]
+        if metrics is not None:
+            metrics.remove(_metric_values(df, keep_id))
+            metrics.remove(_metric_values(df, drop_id))
+        fields = merged_fields(df.loc[keep_id], df.loc[drop_id])
+        if fields:
+            make_room(df, fields)
+            for col, val in fields.items():
+                df.at[keep_id, col] = val
+            storage.update_lead(df, keep_id, fields)
+        storage.merge_history(df, keep_id, drop_id)
+        df.drop(index=drop_id, inplace=True)
+        storage.delete_lead(df, drop_id)
+        if metrics is not None:
+            metrics.add(_metric_values(df, keep_id))
+        _reset_spatial(cache)
+        if cache["search_index"] is not None:
+            cache["search_index"].remove(drop_id)
+            cache["search_index"].update(keep_id, [df.at[keep_id, c] for c in SEARCH_FIELDS if c in df.columns])
+        dismiss_duplicate(drop_id)
+
+def dismiss_duplicate(lead_a, lead_b=None):
+    """Drops the pair (or, with one id, every pair of that lead) from the pending duplicates."""
+    cache = _db_cache()
+    pairs = cache["duplicates"]
+    if pairs is None:
+        return
+    hit = pairs["lead_a"].isin([lead_a]) | pairs["lead_b"].isin([lead_a])
+    if lead_b is not None:
+        hit &= pairs["lead_a"].isin([lead_b]) | pairs["lead_b"].isin([lead_b])
+    cache["duplicates"] = pairs[~hit].reset_index(drop=True)
+
+def scan_duplicates():
+    df = init_db()
+    cache = _db_cache()
+    with cache["lock"]:
+        cache["duplicates"] = find_duplicates(df)
+
+def validate_board_row(fields, require_name=False):
+    """Cleans one edited/added board row; returns (fields, error message or None)."""
+    choices = {"Status": STATUS_OPTIONS, "Sistema": SYSTEM_OPTIONS, "Asignado_A": VENDOR_OPTIONS}
+    clean = {}
+    for col, val in fields.items():
+        if col not in EDITOR_COLUMNS:
+            continue
+        if col in choices and val not in choices[col]:
+            return None, f"{col} inválido: {val}"
+        if col == "Nombre del Local" and not str(val or "").strip():
+            return None, "El nombre es obligatorio"
+        if col == "Priority":
+            val = int(val or 0)
+        elif col == "Rating":
+            val = min(max(float(val or 0), 0.0), 5.0)
+        clean[col] = val
+    if require_name and not str(clean.get("Nombre del Local") or "").strip():
+        return None, "El nombre es obligatorio"
+    return clean, None
+
+def apply_board_changes(page_ids, key):
+    """Board editor callback: persists only the rows the widget reports as edited, added or deleted.
+    Edits to leads that a reload since the page was drawn no longer has are skipped."""
+    df = init_db()
+    delta = st.session_state[key]
+    errors = []
+    for pos, changes in delta.get("edited_rows", {}).items():
+        fields, err = validate_board_row(changes)
+        if err:
+            errors.append(f"Fila {int(pos) + 1}: {err}")
+        elif fields and page_ids[int(pos)] in df.index:
+            update_lead(df, page_ids[int(pos)], fields)
+    for n, row in enumerate(delta.get("added_rows", []), start=1):
+        fields, err = validate_board_row(row, require_name=True)
+        if err:
+            errors.append(f"Fila nueva {n}: {err}")
+        else:
+            insert_lead(df, fields)
+    for pos in delta.get("deleted_rows", []):
+        if page_ids[int(pos)] in df.index:
+            delete_lead(df, page_ids[int(pos)])
+    st.session_state.board_errors = errors
+    st.session_state.board_generation = st.session_state.get("board_generation", 0) + 1
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+def add_note(df, lead_id, note):
+    """Appends a note by the current user to the lead's history."""
+    with _store_write() as storage:
+        storage.add_note(df, lead_id, st.session_state.current_user, note, _now())
+
+def set_checklist_item(df, lead_id, item, done):
+    with _store_write() as storage:
+        storage.set_checklist_item(df, lead_id, item, done, st.session_state.current_user, _now())
+
+def format_ts(ts):
+    """'16/10 18:30' for ISO timestamps; legacy 'HH:MM' entries are shown as stored."""
+    try:
+        return datetime.fromisoformat(ts).strftime("%d/%m %H:%M")
+    except (TypeError, ValueError):
+        return ts
+
+def data_version():
+    """Bumped on every load and write; lets per-session caches tell if the leads changed."""
+    return _db_cache()["version"]
+
+def cache_storage():
+    """The storage backend behind the cached frame, for reads that bypass the frame."""
+    return _db_cache()["storage"]
+
+def get_geo_index(df):
+    """Grid index over the cached frame's coordinates, built once per load and reset on save."""
+    cache = _db_cache()
+    with cache["lock"]:
+        if cache["geo_index"] is None or cache["geo_index"].size != len(df):
+            cache["geo_index"] = GridIndex(df["latitude"].to_numpy(dtype=float, na_value=float("nan")),
+                                           df["longitude"].to_numpy(dtype=float, na_value=float("nan")))
+        return cache["geo_index"]
+
+def get_hours_index(df):
+    """Per-weekday opening intervals of the cached frame, built once per load (reset with the geo index)."""
+    cache = _db_cache()
+    with cache["lock"]:
+        if cache["hours_index"] is None or cache["hours_index"].size != len(df):
+            cache["hours_index"] = HoursIndex.from_frame(df)
+        return cache["hours_index"]
+
+def get_search_index(df):
+    """Text index over name/address/category, built once per load and kept in sync by edits."""
+    cache = _db_cache()
+    with cache["lock"]:
+        if cache["search_index"] is None:
+            cache["search_index"] = SearchIndex.from_frame(df)
+        return cache["search_index"]
+
+def get_map_cells(df):
+    """Per-zoom cluster cells of every lead, computed once per load (reset with the geo index)."""
+    cache = _db_cache()
+    with cache["lock"]:
+        if cache["map_cells"] is None or len(cache["map_cells"][CLUSTER_ZOOMS.start]) != len(df):
+            cache["map_cells"] = precompute_cells(df["latitude"].to_numpy(dtype=float, na_value=float("nan")),
+                                                  df["longitude"].to_numpy(dtype=float, na_value=float("nan")))
+        return cache["map_cells"]
+
+def get_metrics(df):
+    """Pipeline counters of the cached frame, built once per load and kept in sync by edits."""
+    cache = _db_cache()
+    with cache["lock"]:
+        if cache["metrics"] is None:
+            cache["metrics"] = PipelineMetrics.from_frame(df)
+        return cache["metrics"]
+
+def _metric_values(df, lead_id):
+    return {c: df.at[lead_id, c] for c in METRIC_FIELDS if c in df.columns}
+
+def route_stops(df, df_view, only_pending, open_item, start):
+    """Leads of the current view to visit: with coordinates, optionally still 'Por Contactar'
+    and/or without open_item ticked. Capped at MAX_ROUTE_STOPS, nearest to start first."""
+    stops = df_view[df_view["latitude"].notna() & df_view["longitude"].notna()]
+    if only_pending:
+        stops = stops[(stops["Status"] == "Por Contactar").to_numpy()]
+    if open_item != ANY_STAGE:
+        stops = stops[~stops.index.isin(list(cache_storage().leads_with_item_done(df, open_item)))]
+    if len(stops) > MAX_ROUTE_STOPS and start:
+        km = haversine_km(start[0], start[1], stops["latitude"].to_numpy(), stops["longitude"].to_numpy())
+        stops = stops.iloc[np.sort(np.argsort(km, kind="stable")[:MAX_ROUTE_STOPS])]
+    return stops.iloc[:MAX_ROUTE_STOPS]
+
+def visit_route(stops, start):
+    """(stops in visiting order, km), reused across reruns while the stops and start are the same."""
+    key = (tuple(stops.index), start)
+    cached = st.session_state.get("route")
+    if not cached or cached["key"] != key:
+        order, km = plan_route(stops["latitude"].to_numpy(), stops["longitude"].to_numpy(), start=start)
+        cached = st.session_state.route = {"key": key, "ids": stops.index[order], "km": km}
+    return stops.loc[cached["ids"]], cached["km"]
+
+# Helper for display
+def clean_display_text(val, default="No especificado"):
+    if pd.isna(val) or str(val).lower() == "nan" or str(val).strip() == "":
+        return default
+    return val
+
+def patch_map_payload(lead_id, status, version_before):
+    """Recolors one lead in this session's cached map payload instead of rebuilding it.
+
+    Only valid if nothing else changed since the payload was built and the lead
+    still passes the status filter; otherwise the payload is rebuilt on the next run.
+    """
+    cached = st.session_state.get("map_payload")
+    if not cached or cached["version"] != version_before:
+        return
+    sel_status = cached["key"][1]
+    points = cached["points"]
+    hit = (points["lead_id"] == lead_id).to_numpy()
+    if (sel_status and status not in sel_status) or not hit.any():
+        return
+    points.loc[hit, "status"] = status
+    points.loc[hit, "color"] = pd.Series([STATUS_COLORS.get(status, DEFAULT_COLOR)] * int(hit.sum()), index=points.index[hit])
+    cached["version"] = data_version()
+
+def _current_frame(*lead_ids):
+    """The cached frame for a widget callback, reloaded first if the store changed since the
+    widget was drawn; None if the reload dropped one of lead_ids."""
+    df = init_db()
+    return df if all(i in df.index for i in lead_ids) else None
+
+def _on_status_change(idx):
+    df = _current_frame(idx)
+    if df is None:
+        return
+    before = data_version()
+    new_st, new_sys = st.session_state[f"st_{idx}"], st.session_state[f"sys_{idx}"]
+    update_lead(df, idx, {"Status": new_st, "Sistema": new_sys})
+    patch_map_payload(idx, new_st, before)
+
+def _on_checklist_change(idx, item):
+    df = _current_frame(idx)
+    if df is not None:
+        set_checklist_item(df, idx, item, st.session_state[f"chk_{idx}_{item}"])
+
+def _on_save_note(idx):
+    df = _current_frame(idx)
+    txt = st.session_state.get(f"note_{idx}", "")
+    if txt and df is not None:
+        add_note(df, idx, txt)
+        st.session_state[f"note_{idx}"] = ""
+
+def _on_merge(keep_id, drop_id):
+    df = _current_frame(keep_id, drop_id)
+    if df is not None:
+        merge_leads(df, keep_id, drop_id)
+
+@st.fragment
+def lead_profile_panel(idx):
+    """Card, status, checklist and notes of one lead. Its widgets rerun only this fragment,
+    against the shared cached frame, instead of the whole app. The frame is fetched here,
+    not passed in: a fragment rerun must see a reload since the last full run."""
+    timer = run_timer()
+    with timer.phase("profile"):
+        render_profile(init_db(), idx)
+    if timer.kind == "fragment":
+        # A fragment-only rerun: main() isn't running to log it
+        finish_run(timer)
+
+def render_profile(df, idx):
+    if idx not in df.index:
+        return
+    row = df.loc[idx]
+
+    st.markdown(f"""
+    <div class="lead-card">
+        <div style="margin:0; font-size: 1.4rem; font-weight: bold; color: #1f2937;">{row['Nombre del Local']}</div>
+        <div style="color: #6b7280; font-size: 0.9rem; margin-top: 2px;">{row.get('Categoría','Comercio')}</div>
+    </div>
+    """, unsafe_allow_html=True)
+
+    if row.get("URL"):
+        st.link_button("🗺️ CÓMO LLEGAR (Google Maps)", row["URL"], type="primary", use_container_width=True)
+
+    # Details Box
+    addr = clean_display_text(row.get('Dirección'), "Dirección no disponible")
+    rating = row.get('Rating', 0)
+    hours = clean_display_text(row.get('Horario'), "Horario no disponible")
+    web = row.get("Website", "")
+    fallback_web = row.get("URL", "") # Fallback to Maps link if Web is empty
     
-    if not os.path.exists(DB_FILE):
-        df.to_csv(DB_FILE, index=False)
-        
-    return df
+    st.markdown(f"""
+    <div class="black-text" style="background-color: #ffffff; padding: 15px; border-radius: 10px; border: 2px solid #000000; margin: 10px 0;">
+        <p style="margin: 5px 0;">📍 <b>Dirección:</b> {addr}</p>
+        <p style="margin: 5px 0;">⭐ <b>Rating:</b> {rating}</p>
+        <p style="margin: 5px 0;">🕒 <b>Horario:</b> {hours}</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    if web and str(web) != "nan" and str(web).strip() != "":
+         st.link_button("🌐 VER WEB / PEDIDO", web, use_container_width=True, type="primary")
+    elif fallback_web:
+         st.link_button("🌐 VER EN GOOGLE MAPS", fallback_web, use_container_width=True)
 
-def save_db(df):
-    df.to_csv(DB_FILE, index=False)
+    # Status & Management
+    c1, c2 = st.columns(2)
+    curr_status = row["Status"]
+    c1.selectbox("Estado", STATUS_OPTIONS, index=STATUS_OPTIONS.index(curr_status) if curr_status in STATUS_OPTIONS else 0,
+                 key=f"st_{idx}", on_change=_on_status_change, args=(idx,))
+    curr_sys = row.get("Sistema", "Sin Dato")
+    c2.selectbox("Sistema", SYSTEM_OPTIONS, index=SYSTEM_OPTIONS.index(curr_sys) if curr_sys in SYSTEM_OPTIONS else 0,
+                 key=f"sys_{idx}", on_change=_on_status_change, args=(idx,))
 
-def get_status_color(status):
-    if status == "Cliente":
-        return [0, 255, 128, 255] 
-    elif status in ["Visitado", "Demo"]:
-        return [0, 128, 255, 255] 
-    elif status == "Contactado":
-        return [255, 165, 0, 255] 
-    else: 
-        return [255, 80, 80, 255]
+    # Checklist
+    with st.expander("✅ Checklist de Visita", expanded=False):
+        checklist_data = cache_storage().checklist(df, idx)
+        for item in CHECKLIST_ITEMS:
+            st.checkbox(item, value=checklist_data.get(item, False), key=f"chk_{idx}_{item}",
+                        on_change=_on_checklist_change, args=(idx, item))
+
+    # Logs/Notes
+    with st.expander("💬 Notas / Bitácora", expanded=False):
+        st.text_input("Agregar nota...", key=f"note_{idx}")
+        st.button("Guardar Nota", key=f"btn_{idx}", on_click=_on_save_note, args=(idx,))
+        for l in cache_storage().recent_notes(df, idx, 3):
+            st.caption(f"{format_ts(l['ts'])} - {l['author']}: {l['note']}")
+
+def duplicates_panel(df):
+    """Likely duplicate pairs with a one-click merge into the lead with more history."""
+    pairs = _db_cache()["duplicates"]
+    if pairs is not None:
+        pairs = pairs[pairs["lead_a"].isin(df.index) & pairs["lead_b"].isin(df.index)]
+    with st.expander(f"🔁 Posibles duplicados ({0 if pairs is None else len(pairs)})"):
+        st.button("🔍 Buscar en toda la base", on_click=scan_duplicates)
+        if pairs is None:
+            st.caption("Cada importación se revisa sola; para revisar todos los leads, buscá en toda la base.")
+            return
+        if pairs.empty:
+            st.caption("No se encontraron duplicados.")
+            return
+        shown = pairs.head(DUPLICATES_SHOWN)
+        history = cache_storage().history_counts(df, set(shown["lead_a"]) | set(shown["lead_b"]))
+        for pair in shown.itertuples():
+            keep, drop = choose_keep(df, pair.lead_a, pair.lead_b, history)
+            c1, c2, c3 = st.columns([2, 2, 1])
+            for col, lead_id, role in ((c1, keep, "se conserva"), (c2, drop, "se une")):
+                addr = clean_display_text(df.at[lead_id, "Dirección"], "Sin dirección")
+                col.markdown(f"**{df.at[lead_id, 'Nombre del Local']}** ({role})  \n{addr} · {history.get(lead_id, 0)} registros")
+            distance = "" if pd.isna(pair.distance_m) else f" · {pair.distance_m:.0f} m"
+            c3.caption(f"Similitud {pair.score:.0%}{distance}")
+            c3.button("Unir", key=f"merge_{keep}_{drop}", on_click=_on_merge, args=(keep, drop))
+            c3.button("No es duplicado", key=f"dismiss_{keep}_{drop}", on_click=dismiss_duplicate, args=(keep, drop))
+
+def write_status():
+    """Sidebar line telling whether edits are still being written to disk."""
+    writer = cache_storage().writer
+    pending = writer.pending()
+    failed = writer.dead_letters
+    if failed and all(isinstance(err, StaleStoreError) for _, err in failed):
+        # Retrying can't help: the file was changed from the console and the frame reloaded
+        st.sidebar.error(f"⚠️ {len(failed)} cambios no se guardaron: la base se modificó desde la consola "
+                         "y se volvió a cargar. Revisá esos leads y repetí los cambios.")
+        st.sidebar.button("Entendido", on_click=writer.discard_failed)
+    elif failed:
+        st.sidebar.error(f"⚠️ {len(failed)} cambios no se pudieron guardar ({failed[-1][1]})")
+        st.sidebar.button("🔁 Reintentar", on_click=writer.retry_failed)
+    if pending:
+        st.sidebar.caption(f"💾 Guardando {pending} cambios…")
+    elif not failed:
+        st.sidebar.caption("✅ Todo guardado")
+
+def pipeline_panel(df, radius_km):
+    """Funnel, vendor leaderboard and busiest neighbourhoods: from the pipeline counters, or
+    counted over the zone's leads."""
+    metrics = get_metrics(df)
+    center = st.session_state.search_coords
+    scope = "Toda la base"
+    if center and "latitude" in df.columns:
+        scope = st.radio("Alcance", ["Toda la base", f"Zona actual ({radius_km:g} km)"], horizontal=True)
+    if scope != "Toda la base":
+        counts = count_leads(df[get_geo_index(df).radius_mask(center[0], center[1], radius_km)])
+    else:
+        counts = metrics.counts()
+    if counts.empty:
+        st.info("No hay leads en este alcance.")
+        return
+
+    st.subheader("🔻 Embudo")
+    stages = funnel(counts)
+    st.bar_chart(stages["reached"], horizontal=True)
+    st.dataframe(stages.rename(columns={"leads": "En la etapa", "reached": "Llegaron", "step_pct": "% de la etapa anterior"}),
+                 use_container_width=True)
+
+    st.subheader("🏆 Vendedores")
+    st.dataframe(leaderboard(counts).rename(columns={"total": "Total", "client_pct": "% Cliente"}), use_container_width=True)
+
+    with st.expander("💻 Por sistema actual"):
+        st.dataframe(leaderboard(counts, by="Sistema").rename(columns={"total": "Total", "client_pct": "% Cliente"}),
+                     use_container_width=True)
+
+    with st.expander("🏘️ Barrios con más pendientes (bloques de ~1 km)"):
+        blocks = metrics.blocks()
+        if blocks.empty:
+            st.caption("No hay leads con coordenadas.")
+        else:
+            table = blocks.pivot_table(index=["latitude", "longitude"], columns="Status", values="n", aggfunc="sum", fill_value=0)
+            table = table.reindex(columns=STATUS_OPTIONS, fill_value=0)
+            table["Total"] = table.sum(axis=1)
+            st.dataframe(table.sort_values("Por Contactar", ascending=False).head(15).reset_index().round({"latitude": 4, "longitude": 4}),
+                         use_container_width=True, hide_index=True)
+
+def admin_panel():
+    """Hidden timings panel, shown with ?admin=1 in the URL."""
+    log = _timing_log()
+    with st.sidebar.expander("⏱️ Tiempos por fase", expanded=True):
+        recent = records_frame(list(log.recent)[::-1])
+        if recent.empty:
+            st.caption("Sin corridas registradas todavía.")
+            return
+        st.caption(f"Últimas {len(recent)} corridas (ms), la más reciente arriba")
+        st.dataframe(recent, use_container_width=True, hide_index=True)
+        st.caption(f"Percentiles sobre {', '.join(log.files())}")
+        st.dataframe(summarize(log.read_all()), use_container_width=True)
 
 def main():
     st.set_page_config(page_title="Lead Gen CRM", page_icon="🚀", layout="wide")
+    timer = run_timer()
+    timer.kind = "app"
+    try:
+        render_app(timer)
+    finally:
+        # Also logs runs cut short by st.rerun()
+        finish_run(timer)
+    write_status()
+    if st.query_params.get("admin") == "1":
+        admin_panel()
+
+def render_app(timer):
     local_css()
 
     if 'selected_lead_idx' not in st.session_state:
@@ -230,71 +724,92 @@ def main():
     if 'search_coords' not in st.session_state:
         st.session_state.search_coords = None
 
-    df = init_db()
+    # Who is working: recorded as the author of notes and checklist changes
+    st.sidebar.selectbox("👤 Usuario", VENDOR_OPTIONS[1:], key="current_user")
+
+    with timer.phase("init_db"):
+        df = init_db()
     if df is None:
         st.error("No Data Sources Found.")
         return
 
     st.title("🚀 Gamified CRM - Modo Campo")
 
-    # Helper for encoding fix
-    def clean_encoding(text):
-        if not isinstance(text, str): return text
-        if text.lower() == "nan": return ""
-        # Fix common G-Maps scraper encoding issues
-        clean = text.replace('â', '').replace('Â', '').replace('?', ' ')
-        return clean.strip()
-
-    tab_zone, tab_manage = st.tabs(["📍 Zona de Trabajo", "📝 Gestión de Tablero"])
+    tab_zone, tab_pipeline, tab_manage = st.tabs(["📍 Zona de Trabajo", "📊 Pipeline", "📝 Gestión de Tablero"])
 
     with tab_zone:
-        c1, c2, c3 = st.columns([2, 1, 1])
+        c1, c2, c3, c4 = st.columns([2, 1, 1, 1])
         with c1:
             zone_query = st.text_input("🏢 ¿En qué zona estás?", placeholder="Ej. Vicente Lopez, Palermo...")
         with c2:
             sel_status = st.multiselect("Estado", options=STATUS_OPTIONS, default=[])
         with c3:
             filter_online = st.toggle("🛒 Solo 'Pedir en línea'", value=False)
+        with c4:
+            hours_filter = st.selectbox("🕒 Horario", HOURS_FILTERS)
+        radius_km = st.slider("📏 Radio de búsqueda (km)", min_value=0.5, max_value=10.0, value=DEFAULT_RADIUS_KM, step=0.5)
+        route_on = st.toggle("🧭 Planificar ruta de visitas", value=False)
+        if route_on:
+            r1, r2 = st.columns(2)
+            route_only_pending = r1.checkbox("Solo 'Por Contactar'", value=True)
+            route_open_item = r2.selectbox("Sin completar en checklist", [ANY_STAGE] + CHECKLIST_ITEMS)
+
+        # Geocode (gazetteer -> disk cache -> Nominatim) only when the zone text changed
+        if zone_query and zone_query != st.session_state.get("geocoded_query"):
+            with timer.phase("geocode"):
+                st.session_state.search_coords = geocode_zone(zone_query)
+            st.session_state.geocoded_query = zone_query
+            st.session_state.map_view = None
+
+        # Filter Logic: boolean masks over the shared frame; only the rows that pass are materialized
+        with timer.phase("filter"):
+            mask = np.ones(len(df), dtype=bool)
+            order = None
+            zone_mask = None
+
+            # 1. Geo Filter (configurable radius) or Text Search
+            if st.session_state.search_coords and "latitude" in df.columns:
+                center = st.session_state.search_coords
+                zone_mask = get_geo_index(df).radius_mask(center[0], center[1], radius_km)
+                mask &= zone_mask
+            elif zone_query:
+                # Accent/mojibake-insensitive prefix + fuzzy match, best matches first
+                order = df.index.get_indexer(get_search_index(df).search(zone_query))
 
-        # Geocode if zone changed
-        if zone_query:
-            geolocator = Nominatim(user_agent="crm_agent")
-            try:
-                # Append city/country for better context
-                loc = geolocator.geocode(f"{zone_query}, Buenos Aires, Argentina")
-                if loc:
-                    st.session_state.search_coords = (loc.latitude, loc.longitude)
+            # 2. Status Filter
+            if sel_status:
+                mask &= df["Status"].isin(sel_status).to_numpy()
+
+            # 3. Order Online Filter
+            if filter_online:
+                mask &= contains_mask(df["Tiene_Pedido"], "Pedir")
+
+            # 4. Opening Hours Filter, on the leads' clock
+            hours_at = None
+            if hours_filter != HOURS_FILTERS[0]:
+                hours_at = local_now()
+                hours_index = get_hours_index(df)
+                if hours_filter == HOURS_FILTERS[1]:
+                    mask &= hours_index.open_mask(hours_at)
                 else:
-                    st.session_state.search_coords = None
-            except Exception:
-                st.session_state.search_coords = None
+                    mask &= hours_index.opening_mask(hours_at)
 
-        # Filter Logic
-        df_view = df.copy()
-        
-        # 1. Geo Filter (Radius 2km) or Text Search
-        if st.session_state.search_coords and "latitude" in df_view.columns:
-            center = st.session_state.search_coords
-            def is_within_radius(row):
-                if pd.isna(row['latitude']) or pd.isna(row['longitude']): return False
-                try:
-                    point = (row['latitude'], row['longitude'])
-                    return geodesic(center, point).km <= 2.0
-                except: return False
-            df_view = df_view[df_view.apply(is_within_radius, axis=1)]
-        elif zone_query:
-            df_view = df_view[
-                df_view["Dirección"].str.contains(zone_query, case=False, na=False) | 
-                df_view["Nombre del Local"].str.contains(zone_query, case=False, na=False)
-            ]
-        
-        # 2. Status Filter
-        if sel_status:
-            df_view = df_view[df_view["Status"].isin(sel_status)]
-            
-        # 3. Order Online Filter
-        if filter_online:
-            df_view = df_view[df_view["Tiene_Pedido"].astype(str).str.contains("Pedir", case=False, na=False)]
+            if order is not None:
+                df_view = df.iloc[order[mask[order]]]
+            else:
+                df_view = df if mask.all() else df.iloc[np.flatnonzero(mask)]
+        timer.count("rows", len(df))
+        timer.count("view_rows", len(df_view))
+
+        # Visit order through the filtered leads, from the searched zone if there is one
+        route = None
+        if route_on and "latitude" in df.columns:
+            with timer.phase("route"):
+                start = tuple(st.session_state.search_coords) if st.session_state.search_coords else None
+                stops = route_stops(df, df_view, route_only_pending, route_open_item, start)
+                if len(stops):
+                    route, route_km = visit_route(stops, start)
+                    timer.count("route_stops", len(route))
 
         # Map / Profile Split
         idx = st.session_state.selected_lead_idx
@@ -313,52 +828,104 @@ def main():
 
         # 1. MAP SECTION (Always Top)
         st.subheader(f"🗺️ Mapa ({len(df_view)} Locales)")
-        if "latitude" in df_view.columns and not df_view.empty:
-            map_data = df_view.dropna(subset=["latitude", "longitude"]).copy()
-            if not map_data.empty:
-                map_data["color"] = map_data["Status"].apply(get_status_color)
-                map_data['orig_index'] = map_data.index 
-                
-                # Highlight Radius if searching
-                layers = [pdk.Layer(
-                    "ScatterplotLayer",
-                    map_data,
-                    get_position='[longitude, latitude]',
-                    get_color='color',
-                    get_radius=150,
-                    pickable=True,
-                    auto_highlight=True,
-                    id="leads_layer"
-                )]
-
-                # View State logic
-                if idx is not None and idx in map_data.index:
-                    lat, lon, zoom = map_data.at[idx, "latitude"], map_data.at[idx, "longitude"], 15
-                elif st.session_state.search_coords:
-                    lat, lon, zoom = st.session_state.search_coords[0], st.session_state.search_coords[1], 13
-                else:
-                    lat, lon, zoom = map_data["latitude"].mean(), map_data["longitude"].mean(), 12
-
-                event = st.pydeck_chart(pdk.Deck(
-                    layers=layers,
-                    initial_view_state=pdk.ViewState(latitude=lat, longitude=lon, zoom=zoom, pitch=40),
-                    tooltip={"html": "<b>{Nombre del Local}</b><br/>{Status}"},
-                    map_style=None
-                ), on_select="rerun", selection_mode="single-object", use_container_width=True)
-                
-                if event.selection:
-                    objects_dict = event.selection.get("objects")
-                    if objects_dict:
-                        leads_objects = objects_dict.get("leads_layer", [])
-                        if leads_objects:
-                            selected_idx = leads_objects[0].get("orig_index")
-                            if selected_idx is not None and selected_idx != st.session_state.selected_lead_idx:
-                                st.session_state.selected_lead_idx = selected_idx
-                                st.rerun()
+        if "latitude" in df_view.columns and df_view["latitude"].notna().any():
+            # View State logic
+            if idx is not None and idx in df_view.index and pd.notna(df_view.at[idx, "latitude"]):
+                lat, lon, zoom = float(df_view.at[idx, "latitude"]), float(df_view.at[idx, "longitude"]), 15
+            elif st.session_state.get("map_view"):
+                lat, lon, zoom = st.session_state.map_view
+            elif st.session_state.search_coords:
+                lat, lon, zoom = st.session_state.search_coords[0], st.session_state.search_coords[1], 13
+            else:
+                lat, lon, zoom = float(df_view["latitude"].mean()), float(df_view["longitude"].mean()), 12
+
+            # Only id/position/color/name/status go to the browser, culled to the viewport and clustered.
+            # Reused across reruns while the filters, view and data are unchanged.
+            payload_key = (zone_query, tuple(sel_status), filter_online, radius_km,
+                           st.session_state.search_coords, (lat, lon, zoom),
+                           hours_filter, hours_at.strftime("%a %H:%M") if hours_at else None)
+            cached = st.session_state.get("map_payload")
+            if cached and cached["key"] == payload_key and cached["version"] == data_version():
+                points, clusters = cached["points"], cached["clusters"]
+            else:
+                with timer.phase("map_payload"):
+                    points, clusters = build_map_payload(df_view, df.index.get_indexer(df_view.index),
+                                                         get_map_cells(df), lat, lon, zoom)
+                st.session_state.map_payload = {"key": payload_key, "version": data_version(),
+                                                "points": points, "clusters": clusters}
+            layers = [pdk.Layer(
+                "ScatterplotLayer",
+                points,
+                get_position='[longitude, latitude]',
+                get_color='color',
+                get_radius=150,
+                pickable=True,
+                auto_highlight=True,
+                id="leads_layer"
+            )]
+            if route is not None:
+                path = route[["longitude", "latitude"]].astype(float).values.tolist()
+                if start:
+                    path = [[start[1], start[0]]] + path
+                labels = pd.DataFrame({"longitude": route["longitude"].to_numpy(), "latitude": route["latitude"].to_numpy(),
+                                       "label": [str(i) for i in range(1, len(route) + 1)]})
+                layers += [
+                    pdk.Layer("PathLayer", [{"path": path}], get_path="path", get_color=ROUTE_COLOR,
+                              width_min_pixels=4, id="route_path"),
+                    pdk.Layer("TextLayer", labels, get_position='[longitude, latitude]', get_text='label',
+                              get_color=[0, 0, 0, 255], get_size=13, get_pixel_offset=[0, -14], id="route_labels"),
+                ]
+            if not clusters.empty:
+                layers += [
+                    pdk.Layer("ScatterplotLayer", clusters, get_position='[longitude, latitude]', get_color='color',
+                              get_radius='radius', radius_units="pixels", pickable=True, id="clusters_layer"),
+                    pdk.Layer("TextLayer", clusters, get_position='[longitude, latitude]', get_text='label',
+                              get_color=[255, 255, 255, 255], get_size=14, id="cluster_labels"),
+                ]
+
+            deck = pdk.Deck(
+                layers=layers,
+                initial_view_state=pdk.ViewState(latitude=lat, longitude=lon, zoom=zoom, pitch=40),
+                tooltip={"html": "<b>{name}</b><br/>{status}"},
+                map_style=None
+            )
+            timer.count("points", len(points))
+            timer.count("clusters", len(clusters))
+            if st.query_params.get("admin") == "1":
+                # Serializing twice costs as much as the render, so only admins pay for the size
+                timer.count("payload_bytes", len(deck.to_json()))
+            with timer.phase("map_render"):
+                event = st.pydeck_chart(deck, on_select="rerun", selection_mode="single-object", use_container_width=True)
+            if route is not None:
+                capped = f" (máximo {MAX_ROUTE_STOPS}; acotá la zona para incluir el resto)" if len(route) >= MAX_ROUTE_STOPS else ""
+                st.caption(f"🧭 Ruta: {len(route)} paradas, {route_km:.1f} km en línea recta{capped}")
+                with st.expander("Orden de visita"):
+                    visits = route[["Nombre del Local", "Status", "Dirección"]].astype(object)
+                    visits.index = pd.RangeIndex(1, len(visits) + 1, name="#")
+                    st.dataframe(visits, use_container_width=True)
+            elif route_on:
+                st.info("No hay locales para la ruta con estos filtros.")
+            
+            if event.selection:
+                objects_dict = event.selection.get("objects")
+                if objects_dict:
+                    leads_objects = objects_dict.get("leads_layer", [])
+                    cluster_objects = objects_dict.get("clusters_layer", [])
+                    if leads_objects:
+                        selected_idx = leads_objects[0].get("lead_id")
+                        if selected_idx is not None and selected_idx != st.session_state.selected_lead_idx:
+                            st.session_state.selected_lead_idx = selected_idx
+                            st.rerun()
+                    elif cluster_objects:
+                        # Zoom into the tapped cluster
+                        c = cluster_objects[0]
+                        new_view = (c["latitude"], c["longitude"], min(zoom + 2, 16))
+                        if new_view != st.session_state.get("map_view"):
+                            st.session_state.map_view = new_view
+                            st.rerun()
 
         # 2. PROFILE SECTION (Appears here if selected, directly below map)
         if idx is not None and idx in df.index:
-            row = df.loc[idx]
             st.markdown("---")
             
             # Mobile Close Button (Top)
@@ -366,92 +933,19 @@ def main():
                 st.session_state.selected_lead_idx = None
                 st.rerun()
 
-            st.markdown(f"""
-            <div class="lead-card">
-                <div style="margin:0; font-size: 1.4rem; font-weight: bold; color: #1f2937;">{row['Nombre del Local']}</div>
-                <div style="color: #6b7280; font-size: 0.9rem; margin-top: 2px;">{row.get('Categoría','Comercio')}</div>
-            </div>
-            """, unsafe_allow_html=True)
-
-            if row.get("URL"):
-                st.link_button("🗺️ CÓMO LLEGAR (Google Maps)", row["URL"], type="primary", use_container_width=True)
-            
-            # Helper for display
-            def clean_display_text(val, default="No especificado"):
-                if pd.isna(val) or str(val).lower() == "nan" or str(val).strip() == "":
-                    return default
-                return val
-
-            # Details Box
-            addr = clean_encoding(clean_display_text(row.get('Dirección'), "Dirección no disponible"))
-            rating = row.get('Rating', 0)
-            hours = clean_encoding(clean_display_text(row.get('Horario'), "Horario no disponible"))
-            web = clean_encoding(row.get("Website", ""))
-            fallback_web = row.get("URL", "") # Fallback to Maps link if Web is empty
-            
-            st.markdown(f"""
-            <div class="black-text" style="background-color: #ffffff; padding: 15px; border-radius: 10px; border: 2px solid #000000; margin: 10px 0;">
-                <p style="margin: 5px 0;">📍 <b>Dirección:</b> {addr}</p>
-                <p style="margin: 5px 0;">⭐ <b>Rating:</b> {rating}</p>
-                <p style="margin: 5px 0;">🕒 <b>Horario:</b> {hours}</p>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            if web and str(web) != "nan" and str(web).strip() != "":
-                 st.link_button("🌐 VER WEB / PEDIDO", web, use_container_width=True, type="primary")
-            elif fallback_web:
-                 st.link_button("🌐 VER EN GOOGLE MAPS", fallback_web, use_container_width=True)
-
-            # Status & Management
-            c1, c2 = st.columns(2)
-            curr_status = row["Status"]
-            new_st = c1.selectbox("Estado", STATUS_OPTIONS, index=STATUS_OPTIONS.index(curr_status) if curr_status in STATUS_OPTIONS else 0, key=f"st_{idx}")
-            
-            curr_sys = row.get("Sistema", "Sin Dato")
-            new_sys = c2.selectbox("Sistema", SYSTEM_OPTIONS, index=SYSTEM_OPTIONS.index(curr_sys) if curr_sys in SYSTEM_OPTIONS else 0, key=f"sys_{idx}")
-            
-            if new_st != curr_status or new_sys != curr_sys:
-                 df.at[idx, "Status"] = new_st
-                 df.at[idx, "Sistema"] = new_sys
-                 save_db(df)
-                 st.rerun()
-
-            # Checklist
-            with st.expander("✅ Checklist de Visita", expanded=False):
-                checklist_data = json.loads(row.get("Checklist", "{}"))
-                updated_cl = {}
-                changed = False
-                for item in CHECKLIST_ITEMS:
-                    val = st.checkbox(item, value=checklist_data.get(item, False), key=f"chk_{idx}_{item}")
-                    updated_cl[item] = val
-                    if val != checklist_data.get(item, False):
-                        changed = True
-                if changed:
-                    df.at[idx, "Checklist"] = json.dumps(updated_cl)
-                    save_db(df)
-
-            # Logs/Notes
-            with st.expander("💬 Notas / Bitácora", expanded=False):
-                logs = json.loads(row.get("Interaction_Log", "[]"))
-                txt = st.text_input("Agregar nota...", key=f"note_{idx}")
-                if st.button("Guardar Nota", key=f"btn_{idx}") and txt:
-                    logs.insert(0, {"user": "Yo", "date": datetime.now().strftime("%H:%M"), "note": txt})
-                    df.at[idx, "Interaction_Log"] = json.dumps(logs)
-                    save_db(df)
-                    st.rerun()
-                for l in logs[:3]:
-                    st.caption(f"{l['date']} - {l['note']}")
+            lead_profile_panel(idx)
 
         # 3. LIST & METRICS (Bottom)
         st.divider()
         st.caption("👇 Lista de Locales:")
-        event_list = st.dataframe(
-            df_view[["Nombre del Local", "Status", "Dirección"]],
-            use_container_width=True,
-            hide_index=True,
-            on_select="rerun",
-            selection_mode="single-row"
-        )
+        with timer.phase("list"):
+            event_list = st.dataframe(
+                df_view[["Nombre del Local", "Status", "Dirección"]],
+                use_container_width=True,
+                hide_index=True,
+                on_select="rerun",
+                selection_mode="single-row"
+            )
         if event_list.selection and event_list.selection.rows:
             row_idx = event_list.selection.rows[0]
             real_idx = df_view.index[row_idx]
@@ -460,16 +954,46 @@ def main():
                  st.rerun()
 
         st.markdown("---")
+        with timer.phase("metrics"):
+            if zone_mask is None and order is None and not filter_online and hours_at is None:
+                # Status filter only: summed from the pipeline counters, not counted over the leads
+                zone = get_metrics(df).counts()
+                if sel_status:
+                    zone = zone[zone["Status"].isin(sel_status)]
+                by_status, total = zone.groupby("Status")["n"].sum(), int(zone["n"].sum())
+            else:
+                by_status, total = df_view["Status"].value_counts(), len(df_view)
         m1, m2, m3 = st.columns(3)
-        m1.metric("Total Zona", len(df_view))
-        m2.metric("Clientes", len(df_view[df_view["Status"]=="Cliente"]))
-        m3.metric("Pendientes", len(df_view[df_view["Status"]=="Por Contactar"]))
+        m1.metric("Total Zona", total)
+        m2.metric("Clientes", int(by_status.get("Cliente", 0)))
+        m3.metric("Pendientes", int(by_status.get("Por Contactar", 0)))
+
+    # --- TAB 2: PIPELINE ---
+    with tab_pipeline:
+        with timer.phase("pipeline"):
+            pipeline_panel(df, radius_km)
 
-    # --- TAB 2: GESTIÓN DE TABLERO ---
+    # --- TAB 3: GESTIÓN DE TABLERO ---
     with tab_manage:
         st.subheader("📋 Base de Datos de Leads")
+        # Deferred: the CSV is only built when the button is actually clicked
+        st.download_button("⬇️ Exportar CSV", lambda: cache_storage().export_frame(df).to_csv(index=True, index_label="lead_id").encode("utf-8"),
+                           file_name="leads_db.csv", mime="text/csv")
+
+        with st.expander("🕑 Actividad reciente"):
+            events = cache_storage().recent_events(df, 50)
+            if events.empty:
+                st.caption("Todavía no hay notas ni checklist registrados.")
+            else:
+                events["Local"] = events["lead_id"].map(df["Nombre del Local"])
+                events["ts"] = events["ts"].map(format_ts)
+                st.dataframe(events[["ts", "author", "Local", "kind", "item", "value"]], use_container_width=True, hide_index=True)
         
+        duplicates_panel(df)
+
         # Add Lead Form
+        if st.session_state.get("duplicate_notice"):
+            st.warning(st.session_state.pop("duplicate_notice"))
         with st.expander("➕ Agregar Nuevo Lead Manualmente"):
             with st.form("add_lead"):
                 c1, c2 = st.columns(2)
@@ -488,24 +1012,37 @@ def main():
                             "Status": "Por Contactar",
                             "latitude": new_lat if new_lat != 0 else None,
                             "longitude": new_lon if new_lon != 0 else None,
-                            "Checklist": "{}",
-                            "Interaction_Log": "[]",
                             "Rating": 0
                         }
-                        # Append using pandas concat
-                        new_df_row = pd.DataFrame([new_row])
-                        df = pd.concat([df, new_df_row], ignore_index=True)
-                        save_db(df)
+                        lead_id = insert_lead(df, new_row)
                         st.success(f"Lead '{new_name}' creado!")
+                        dupes = _db_cache()["duplicates"]
+                        if dupes is not None and (dupes["lead_a"].eq(lead_id) | dupes["lead_b"].eq(lead_id)).any():
+                            st.session_state.duplicate_notice = f"'{new_name}' se parece a un lead que ya existe: revisalo en Posibles duplicados."
                         st.rerun()
                     else:
                         st.error("El nombre es obligatorio")
         
-        # Full Editor
-        edited_df = st.data_editor(df, use_container_width=True, num_rows="dynamic", key="full_editor")
-        if not df.equals(edited_df):
-            df.update(edited_df)
-            save_db(df)
+        # Board Editor: one page of the relevant columns; only the row deltas are persisted
+        if st.session_state.get("board_errors"):
+            st.warning("No se guardaron algunos cambios:\n\n" + "\n".join(st.session_state.board_errors))
+        c1, c2 = st.columns([3, 1])
+        board_query = c1.text_input("🔎 Filtrar tablero", placeholder="Nombre, dirección o categoría...")
+        board_ids = pd.Index(get_search_index(df).search(board_query)) if board_query else df.index
+        n_pages = max(1, -(-len(board_ids) // EDITOR_PAGE_SIZE))
+        page = c2.number_input(f"Página (de {n_pages})", min_value=1, max_value=n_pages, value=1, step=1)
+        page_ids = board_ids[(page - 1) * EDITOR_PAGE_SIZE:page * EDITOR_PAGE_SIZE]
+        page_df = df.loc[page_ids, [c for c in EDITOR_COLUMNS if c in df.columns]]
+        # Free-text categoricals stay editable as text; the option columns have their own selectboxes
+        page_df = page_df.astype({c: object for c in page_df.columns
+                                  if isinstance(page_df[c].dtype, pd.CategoricalDtype) and c not in EDITOR_COLUMN_CONFIG})
+
+        # A new key after each save gives the editor a clean delta state for the refreshed page
+        editor_key = f"board_editor_{st.session_state.get('board_generation', 0)}"
+        with timer.phase("board"):
+            st.data_editor(page_df, use_container_width=True, num_rows="dynamic", key=editor_key,
+                           column_config=EDITOR_COLUMN_CONFIG, on_change=apply_board_changes,
+                           args=(list(page_ids), editor_key))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,215 @@
+"""Times the app's hot paths on synthetic data at several sizes and writes the results as JSON.
+
+    python benchmarks/bench.py                          # 1k, 100k and 1M leads
+    python benchmarks/bench.py --sizes 1000,100000 --compare benchmarks/results/<previous>.json
+
+Each benchmark reports min/median wall time over a few runs and, from one extra
+run under tracemalloc, the peak Python/NumPy memory it allocated. --compare
+exits non-zero when a median got slower than the threshold, so it can gate a CI job.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd  # noqa: E402
+
+import synth  # noqa: E402
+from geo import GridIndex  # noqa: E402
+from ingest import (EXT_DATA, MANIFEST_FILE, _head_digest, export_paths, extract_url_fields,  # noqa: E402
+                    import_exports, load_manifest, read_header, save_manifest)
+from leads import LEAD_DEFAULTS, build_db  # noqa: E402
+from map_data import build_map_payload, precompute_cells  # noqa: E402
+from search import SearchIndex  # noqa: E402
+from storage import DB_FILE, SQLITE_FILE, CsvStorage, SqliteStorage  # noqa: E402
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+MAX_SECONDS_PER_BENCH = 20.0     # stop repeating a benchmark once it has used this much time
+RADIUS_KM = 2.0
+TEXT_QUERIES = ["palermo", "cafe porteno", "pizzeria nunez", "hipolito yrigoyen", "farolto"]
+SYNC_SHARE = 0.01                # size of the appended export, relative to the base one
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(fn, setup=None, repeat=5):
+    """(run times in seconds, peak traced MiB) of fn(setup()), setup excluded from both."""
+    times, started = [], time.perf_counter()
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        t0 = time.perf_counter()
+        fn(arg)
+        times.append(time.perf_counter() - t0)
+        if time.perf_counter() - started > MAX_SECONDS_PER_BENCH:
+            break
+    arg = setup() if setup else None
+    tracemalloc.start()
+    try:
+        fn(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return times, peak / 2 ** 20
+
+
+class Suite:
+    def __init__(self, size, backend, repeat):
+        self.size, self.backend, self.repeat = size, backend, repeat
+        self.results = []
+
+    def storage(self):
+        return SqliteStorage() if self.backend == "sqlite" else CsvStorage()
+
+    def run(self, name, fn, setup=None, per_call=1):
+        times, peak = measure(fn, setup, self.repeat)
+        times = [t / per_call for t in times]
+        result = {"size": self.size, "name": name, "runs": len(times),
+                  "min_s": min(times), "median_s": statistics.median(times), "peak_mib": round(peak, 2)}
+        self.results.append(result)
+        print(f"{self.size:>9,} {name:<24} median {result['median_s'] * 1e3:10.2f} ms"
+              f"   min {result['min_s'] * 1e3:10.2f} ms   peak {peak:8.1f} MiB", flush=True)
+        return result
+
+    def _clear_store(self):
+        for path in (DB_FILE, SQLITE_FILE, f"{SQLITE_FILE}-wal", f"{SQLITE_FILE}-shm", MANIFEST_FILE):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def all(self):
+        n = self.size
+        synth.write_export(EXT_DATA, n)
+        urls = pd.read_csv(EXT_DATA, usecols=["hfpxzc href"], dtype=str, encoding="latin1")["hfpxzc href"]
+
+        self.run("extract_coordinates", lambda _: extract_url_fields(urls))
+
+        # init_db on a fresh install: whole export imported and stored
+        self.run("init_db_cold", lambda s: build_db(s)[0], setup=lambda: (self._clear_store(), self.storage())[1])
+        # init_db against a legacy leads_db.csv: URL parsing, history migration, then nothing to import
+        def legacy():
+            self._clear_store()
+            synth.write_crm_db(DB_FILE, n)
+            size = os.path.getsize(EXT_DATA)
+            save_manifest({os.path.normpath(p): {"offset": size, "header": read_header(p), "head": _head_digest(p, size)}
+                           for p in export_paths()})
+            if self.backend == "sqlite":
+                SqliteStorage().save(CsvStorage().load())
+            return self.storage()
+        self.run("init_db_legacy", lambda s: build_db(s)[0], setup=legacy)
+        # init_db on a later start: everything already stored and ingested
+        df, _ = build_db(self.storage())
+        self.run("init_db_warm", lambda s: build_db(s)[0], setup=self.storage)
+
+        # Metadata sync: a new export that overlaps the known leads and adds a few new ones
+        os.makedirs("exports", exist_ok=True)
+        extra = max(1, int(n * SYNC_SHARE))
+        pd.concat([synth.leads(extra, seed=0), synth.leads(extra, seed=0, offset=n)]).to_csv(
+            os.path.join("exports", "extra.csv"), index=False, encoding="utf-8")
+        manifest = load_manifest()
+        self.run("metadata_sync", lambda frame: import_exports(frame, LEAD_DEFAULTS, manifest=manifest),
+                 setup=df.copy)
+        shutil.rmtree("exports")
+
+        lats, lons = df["latitude"].to_numpy(), df["longitude"].to_numpy()
+        rng = np.random.default_rng(1)
+        centers = list(zip(rng.normal(synth.CENTER[0], 0.03, 50), rng.normal(synth.CENTER[1], 0.04, 50)))
+        self.run("geo_index_build", lambda _: GridIndex(lats, lons))
+        geo = GridIndex(lats, lons)
+        self.run("radius_filter", lambda _: [df.iloc[geo.query_radius(la, lo, RADIUS_KM)] for la, lo in centers],
+                 per_call=len(centers))
+
+        self.run("search_index_build", lambda _: SearchIndex.from_frame(df))
+        index = SearchIndex.from_frame(df)
+        self.run("text_filter", lambda _: [df.loc[index.search(q)] for q in TEXT_QUERIES], per_call=len(TEXT_QUERIES))
+
+        self.run("map_cells_build", lambda _: precompute_cells(lats, lons))
+        cells = precompute_cells(lats, lons)
+        positions = np.arange(len(df))
+        for zoom in (12, 15):
+            self.run(f"map_payload_z{zoom}",
+                     lambda _, z=zoom: build_map_payload(df, positions, cells, *synth.CENTER, z))
+
+        store = self.storage()
+        self.run("save_db", lambda _: store.save(df))
+        lead_id = int(df.index[len(df) // 2])
+        self.run("update_lead", lambda _: store.update_lead(df, lead_id, {"Status": "Cliente"}))
+        return self.results
+
+
+def compare(results, baseline_path, threshold):
+    """Prints current/baseline median ratios; returns the benchmarks slower than threshold."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["size"], r["name"]): r for r in json.load(f)["results"]}
+    regressions = []
+    print(f"\nvs {baseline_path}")
+    for r in results:
+        base = baseline.get((r["size"], r["name"]))
+        if not base or not base["median_s"]:
+            continue
+        ratio = r["median_s"] / base["median_s"]
+        flag = "  << slower" if ratio > threshold else ""
+        print(f"{r['size']:>9,} {r['name']:<24} x{ratio:6.2f}   peak {base['peak_mib']:8.1f} -> {r['peak_mib']:8.1f} MiB{flag}")
+        if flag:
+            regressions.append(r)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated lead counts (default: %(default)s)")
+    parser.add_argument("--storage", choices=["sqlite", "csv"], default="sqlite")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", help="results file (default: benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    results = []
+    for size in [int(s) for s in args.sizes.split(",")]:
+        workdir = tempfile.mkdtemp(prefix=f"crm-bench-{size}-")
+        cwd = os.getcwd()
+        os.chdir(workdir)   # the app reads and writes its files relative to the working directory
+        try:
+            results += Suite(size, args.storage, args.repeat).all()
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    meta = {"timestamp": datetime.now().isoformat(timespec="seconds"), "commit": commit, "storage": args.storage,
+            "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+            "machine": platform.machine(), "platform": platform.platform()}
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=1)
+    print(f"\nwrote {out}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
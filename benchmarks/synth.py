@@ -0,0 +1,116 @@
+"""Synthetic scraper exports and CRM databases shaped like the real google.csv / leads_db.csv."""
+import json
+
+import numpy as np
+import pandas as pd
+
+# Buenos Aires (CABA + first ring of GBA)
+CENTER = (-34.60, -58.44)
+SPREAD_DEG = (0.12, 0.16)
+
+PREFIXES = ["La", "El", "Café", "Bar", "Pizzería", "Parrilla", "Cervecería", "Heladería", "Panadería", "Bodegón"]
+WORDS = ["Porteño", "Esquina", "Molino", "Tano", "Gaucho", "Ñandú", "Colón", "Martín", "Vaguesa", "Farolito",
+         "Rosedal", "Belgrano", "Almagro", "Boedo", "Palermo", "Núñez", "Caballito", "Tigre", "Olivos", "Sur"]
+CATEGORIES = ["Restaurante", "Cafetería", "Bar", "Hamburguesa", "Pizzería", "Heladería", "Panadería", "Parrilla"]
+STREETS = ["Av. Corrientes", "Av. Santa Fe", "Pres. Hipólito Yrigoyen", "Av. Rivadavia", "Thames", "Gorriti",
+           "Av. Cabildo", "Güemes", "Av. Córdoba", "Honduras", "Dorrego", "Av. Libertador"]
+HOURS = ["Abierto · Cierra a las 11 p.m.", "Cerrado · Abre a las 7 p.m.", "Abierto las 24 horas",
+         "Cerrado · Abre a las 8 a.m.", "", "Abierto · Cierra a las 1 a.m."]
+STATUSES = ["Por Contactar", "Contactado", "Visitado", "Demo", "Cliente"]
+STATUS_WEIGHTS = [0.7, 0.12, 0.08, 0.04, 0.06]
+SYSTEMS = ["Sin Dato", "Fudo", "Bistrosoft", "BCN", "Otro"]
+VENDORS = ["Sin Asignar", "Seba", "Facu"]
+CHECKLIST_ITEMS = ["Verificar Teléfono", "Enviar Presentación", "Llamada Inicial", "Agendar Visita", "Visita Realizada"]
+
+MOJIBAKE_RATE = 0.15      # share of names/addresses stored double-decoded ("NÃºÃ±ez")
+NO_URL_RATE = 0.01        # blank scraper rows, as at the top of the real google.csv
+
+
+def _mojibake(text):
+    return text.encode("utf-8").decode("latin1")
+
+
+def _pick(rng, options, n, p=None):
+    return np.asarray(options, dtype=object)[rng.choice(len(options), size=n, p=p)]
+
+
+def _place_ids(rng, n, offset=0):
+    hi = rng.integers(0x95bc0000_00000000, 0x95bcffff_ffffffff, size=n, dtype=np.uint64)
+    lo = np.arange(offset, offset + n, dtype=np.uint64) * np.uint64(0x9E3779B1) + np.uint64(0x1000)
+    return [f"0x{a:x}:0x{b:x}" for a, b in zip(hi.tolist(), lo.tolist())]
+
+
+def _maps_url(name, place_id, lat, lon):
+    slug = name.replace(" ", "+")
+    return (f"https://www.google.com/maps/place/{slug}/data=!4m7!3m6!1s{place_id}"
+            f"!8m2!3d{lat:.7f}!4d{lon:.7f}!16s%2Fg%2F11p0wr_gs_?authuser=1&hl=es&rclk=1")
+
+
+def leads(n, seed=0, offset=0):
+    """Frame of n synthetic leads with export-side fields, before column renaming."""
+    rng = np.random.default_rng(seed + offset)
+    names = [f"{p} {w} {i}" for p, w, i in zip(_pick(rng, PREFIXES, n), _pick(rng, WORDS, n),
+                                                rng.integers(1, 999, size=n).tolist())]
+    addrs = [f"{s} {num}" for s, num in zip(_pick(rng, STREETS, n), rng.integers(100, 9000, size=n).tolist())]
+    garbled = rng.random(n) < MOJIBAKE_RATE
+    names = [_mojibake(t) if g else t for t, g in zip(names, garbled)]
+    addrs = [_mojibake(t) if g else t for t, g in zip(addrs, garbled)]
+    lats = CENTER[0] + rng.normal(0, SPREAD_DEG[0] / 2, n)
+    lons = CENTER[1] + rng.normal(0, SPREAD_DEG[1] / 2, n)
+    place_ids = _place_ids(rng, n, offset)
+    urls = [_maps_url(nm, pid, la, lo) for nm, pid, la, lo in zip(names, place_ids, lats.tolist(), lons.tolist())]
+    blank = rng.random(n) < NO_URL_RATE
+    ratings = np.round(rng.uniform(3.0, 5.0, n), 1)
+    return pd.DataFrame({
+        "hfpxzc href": np.where(blank, "", np.asarray(urls, dtype=object)),
+        "qBF1Pd": names,
+        "MW4etd": [f"{r:.1f}".replace(".", ",") for r in ratings.tolist()],
+        "UY7F9": [f"({c})" for c in rng.integers(1, 5000, size=n).tolist()],
+        "W4Efsd": _pick(rng, CATEGORIES, n),
+        "W4Efsd 4": addrs,
+        "W4Efsd 6": _pick(rng, HOURS, n),
+        "ah5Ghc": "",
+        "A1zNzb href": np.where(rng.random(n) < 0.3, "https://pedidos.example.com/" + pd.Series(place_ids), ""),
+        "J8zHNe": np.where(rng.random(n) < 0.3, "Pedir en línea", ""),
+    })
+
+
+def write_export(path, n, seed=0, offset=0):
+    """Writes a google.csv-style scraper export with n rows (UTF-8, read back as latin1 like the real one)."""
+    leads(n, seed, offset).to_csv(path, index=False, encoding="utf-8")
+
+
+def _history(rng, n):
+    """Legacy Checklist / Interaction_Log JSON cells for n leads; most leads have none."""
+    checklists, logs = [], []
+    touched = rng.random(n) < 0.25
+    for t in touched.tolist():
+        if not t:
+            checklists.append("{}")
+            logs.append("[]")
+            continue
+        k = int(rng.integers(1, len(CHECKLIST_ITEMS) + 1))
+        checklists.append(json.dumps({item: bool(rng.random() < 0.7) for item in CHECKLIST_ITEMS[:k]}))
+        logs.append(json.dumps([{"user": str(rng.choice(VENDORS[1:])), "date": f"2025-0{m}-1{m} 10:3{m}",
+                                 "note": f"Visita {m}: habló con el encargado"}
+                                for m in range(int(rng.integers(1, 4)), 0, -1)]))
+    return checklists, logs
+
+
+def write_crm_db(path, n, seed=0):
+    """Writes a legacy leads_db.csv holding the same first n leads as write_export(.., n, seed)."""
+    from ingest import COLUMN_MAPPING
+
+    rng = np.random.default_rng(seed + 1_000_003)
+    df = leads(n, seed).rename(columns=COLUMN_MAPPING)
+    df = df[df["URL"] != ""].reset_index(drop=True)
+    m = len(df)
+    df["Status"] = _pick(rng, STATUSES, m, STATUS_WEIGHTS)
+    df["Sistema"] = _pick(rng, SYSTEMS, m)
+    df["Asignado_A"] = _pick(rng, VENDORS, m)
+    df["Notas"] = ""
+    df["Priority"] = rng.integers(0, 4, size=m)
+    df["Checklist"], df["Interaction_Log"] = _history(rng, m)
+    df.index = pd.RangeIndex(1, m + 1, name="lead_id")
+    df.to_csv(path, index=True)
+    return m
@@ -0,0 +1,216 @@
+"""Bulk operations on the leads without the UI.
+
+    python cli.py import                                    # ingest new scraper exports
+    python cli.py stats --zone palermo
+    python cli.py assign Seba --status "Por Contactar" --near=-34.58,-58.42 --radius 3
+    python cli.py set-status "Por Contactar" --vendor Facu --status Contactado --dry-run
+    python cli.py territories --weights Seba=2,Facu=1       # split the unassigned leads
+    python cli.py export backup.csv
+
+Uses the same loading and storage code as the app (leads.py, storage.py) and
+never imports Streamlit. Every command that writes does so in one transaction
+(one atomic file replace for the CSV store) and refreshes the Parquet snapshot.
+A running app notices the changed store on its next rerun and reloads it (from
+that snapshot, without a rebuild). The CSV store is rewritten whole, so a write
+over a file someone else changed since it was loaded is refused, here and in
+the app, instead of undoing their edits.
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from geo import GridIndex
+from geocoding import geocode_zone
+from leads import load_leads, sources_signature
+from metrics import count_leads, funnel, leaderboard
+from schema import STATUS_OPTIONS, SYSTEM_OPTIONS, VENDOR_OPTIONS, make_room
+from search import SearchIndex
+from storage import ID_COL, StaleStoreError, get_storage, save_snapshot
+from territory import capacities, partition
+
+UNASSIGNED = VENDOR_OPTIONS[0]
+
+
+def _report(level, message):
+    print(f"{level}: {message}", file=sys.stderr)
+
+
+def _coords(text):
+    try:
+        lat, lon = (float(v) for v in text.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected LAT,LON, got {text!r}")
+    return lat, lon
+
+
+def _weights(text):
+    """"Seba=2,Facu=1" -> {"Seba": 2.0, "Facu": 1.0}."""
+    weights = {}
+    for part in text.split(","):
+        name, _, value = part.partition("=")
+        if name not in VENDOR_OPTIONS[1:]:
+            raise argparse.ArgumentTypeError(f"unknown vendor {name!r} (one of {', '.join(VENDOR_OPTIONS[1:])})")
+        try:
+            weights[name] = float(value or 1)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"bad weight for {name}: {value!r}")
+    return weights
+
+
+def _center(args):
+    if args.near:
+        return args.near
+    if args.zone:
+        center = geocode_zone(args.zone)
+        if center is None:
+            sys.exit(f"zone not found: {args.zone}")
+        return center
+    return None
+
+
+def select(df, args):
+    """Boolean mask of the leads matching the filter flags (all of them when none is given)."""
+    mask = np.ones(len(df), dtype=bool)
+    for flag, col in (("status", "Status"), ("vendor", "Asignado_A"), ("system", "Sistema")):
+        values = getattr(args, flag)
+        if values:
+            mask &= df[col].isin(values).to_numpy()
+    center = _center(args)
+    if center is not None:
+        index = GridIndex(df["latitude"].to_numpy(dtype=float, na_value=float("nan")),
+                          df["longitude"].to_numpy(dtype=float, na_value=float("nan")))
+        mask &= index.radius_mask(center[0], center[1], args.radius)
+    if args.query:
+        mask &= df.index.isin(SearchIndex.from_frame(df).search(args.query))
+    return mask
+
+
+def write_back(storage, df, lead_ids, columns, signature):
+    """Persists columns of lead_ids in one transaction and re-snapshots the frame.
+
+    signature is what df was loaded from; if the store changed since (the app
+    wrote it), df lacks those edits and the snapshot is left for the next load to rebuild.
+    """
+    current = storage.signature() == signature[0]
+    storage.update_rows(df, list(lead_ids), columns)
+    if current:
+        save_snapshot(df, sources_signature(storage))
+
+
+def set_column(storage, df, mask, col, value, args):
+    ids = df.index[mask & (df[col] != value).to_numpy()]
+    print(f"{len(ids)} leads -> {col} = {value}" + (" (dry run)" if args.dry_run else ""))
+    if args.dry_run or not len(ids):
+        return
+    make_room(df, {col: value})
+    df.loc[ids, col] = value
+    write_back(storage, df, ids, [col], args.signature)
+
+
+def cmd_import(storage, df, inserted, args):
+    print(f"{len(df)} leads, {len(inserted)} new from the exports")
+
+
+def cmd_stats(storage, df, inserted, args):
+    view = df[select(df, args)]
+    counts = count_leads(view)
+    if counts.empty:
+        print("no leads match")
+        return
+    print(f"{len(view)} leads\n")
+    print(funnel(counts).to_string(), end="\n\n")
+    print(leaderboard(counts).to_string())
+
+
+def cmd_assign(storage, df, inserted, args):
+    set_column(storage, df, select(df, args), "Asignado_A", args.to, args)
+
+
+def cmd_set_status(storage, df, inserted, args):
+    set_column(storage, df, select(df, args), "Status", args.to, args)
+
+
+def cmd_territories(storage, df, inserted, args):
+    weights = args.weights or {v: 1.0 for v in VENDOR_OPTIONS[1:]}
+    mask = select(df, args) & df["latitude"].notna().to_numpy() & df["longitude"].notna().to_numpy()
+    if not args.reassign:
+        mask &= (df["Asignado_A"] == UNASSIGNED).to_numpy()
+    ids = df.index[mask]
+    if not len(ids):
+        print("no leads with coordinates to split")
+        return
+    vendors = list(weights)
+    caps = capacities(len(ids), list(weights.values()))
+    labels = partition(df.loc[ids, "latitude"].to_numpy(dtype=float), df.loc[ids, "longitude"].to_numpy(dtype=float),
+                       caps, seed=args.seed)
+    assigned = np.array(vendors, dtype=object)[labels]
+
+    summary = pd.DataFrame({"vendor": assigned, "lat": df.loc[ids, "latitude"].to_numpy(dtype=float),
+                            "lon": df.loc[ids, "longitude"].to_numpy(dtype=float)})
+    print(summary.groupby("vendor").agg(leads=("lat", "size"), center_lat=("lat", "mean"), center_lon=("lon", "mean"))
+          .round(4).to_string())
+    if args.dry_run:
+        print("(dry run)")
+        return
+    for vendor in vendors:
+        make_room(df, {"Asignado_A": vendor})
+    df.loc[ids, "Asignado_A"] = assigned
+    write_back(storage, df, ids, ["Asignado_A"], args.signature)
+    print(f"{len(ids)} leads assigned")
+
+
+def cmd_export(storage, df, inserted, args):
+    storage.export_frame(df).to_csv(args.path, index=True, index_label=ID_COL)
+    print(f"wrote {len(df)} leads to {args.path}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    filters = argparse.ArgumentParser(add_help=False)
+    group = filters.add_argument_group("lead filters (combined with AND)")
+    group.add_argument("--status", action="append", choices=STATUS_OPTIONS, help="current Status; repeatable")
+    group.add_argument("--vendor", action="append", choices=VENDOR_OPTIONS, help="current Asignado_A; repeatable")
+    group.add_argument("--system", action="append", choices=SYSTEM_OPTIONS, help="current Sistema; repeatable")
+    group.add_argument("--zone", help="zone name, geocoded like the app's zone search")
+    group.add_argument("--near", type=_coords, metavar="LAT,LON", help="zone centre as coordinates; write --near=LAT,LON when LAT is negative")
+    group.add_argument("--radius", type=float, default=2.0, help="zone radius in km (default: %(default)s)")
+    group.add_argument("--query", help="name/address/category text search")
+    writes = argparse.ArgumentParser(add_help=False)
+    writes.add_argument("--dry-run", action="store_true", help="show what would change without writing")
+
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("import", help="ingest new rows of google.csv and exports/*.csv").set_defaults(run=cmd_import)
+    sub.add_parser("stats", parents=[filters], help="funnel and vendor leaderboard").set_defaults(run=cmd_stats)
+    p = sub.add_parser("assign", parents=[filters, writes], help="set Asignado_A of the matching leads")
+    p.add_argument("to", choices=VENDOR_OPTIONS)
+    p.set_defaults(run=cmd_assign)
+    p = sub.add_parser("set-status", parents=[filters, writes], help="set Status of the matching leads")
+    p.add_argument("to", choices=STATUS_OPTIONS)
+    p.set_defaults(run=cmd_set_status)
+    p = sub.add_parser("territories", parents=[filters, writes],
+                       help="split the unassigned matching leads into compact territories of balanced size")
+    p.add_argument("--weights", type=_weights, metavar="VENDOR=W,...",
+                   help="vendors to split between and their relative share (default: every vendor, equal shares)")
+    p.add_argument("--reassign", action="store_true", help="also redistribute leads that already have a vendor")
+    p.add_argument("--seed", type=int, default=0, help="seed for the starting centres")
+    p.set_defaults(run=cmd_territories)
+    p = sub.add_parser("export", help="full CSV export, notes and checklist included")
+    p.add_argument("path")
+    p.set_defaults(run=cmd_export)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    storage = get_storage()
+    df, inserted, args.signature = load_leads(storage, _report)
+    try:
+        args.run(storage, df, inserted, args)
+    except StaleStoreError as e:
+        sys.exit(f"not saved: {e}")
+
+
+if __name__ == "__main__":
+    main()
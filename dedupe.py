@@ -0,0 +1,231 @@
+"""Duplicate-lead detection: candidate pairs blocked by grid cell and name token, then scored."""
+import re
+
+import numpy as np
+import pandas as pd
+
+from geo import haversine_km
+from hours import HOURS_COLUMNS, hours_fields
+from schema import STATUS_OPTIONS
+from search import _trigrams
+from textnorm import fold, fold_series
+
+CELL_DEG = 0.0015              # ~150 m; a lead is compared with its own and the 8 surrounding cells
+MAX_DISTANCE_M = 150.0
+MIN_SCORE = 0.72
+MAX_TOKEN_BLOCK = 200          # leads without coordinates: skip name tokens shared by more leads than this
+WEIGHTS = {"name": 0.6, "address": 0.25, "distance": 0.15}
+# Words that say what a place is rather than which one it is
+STOPWORDS = {"la", "el", "los", "las", "de", "del", "y", "en", "bar", "cafe", "cafeteria", "resto", "restaurante",
+             "restaurant", "pizzeria", "parrilla", "heladeria", "panaderia", "cerveceria", "bodegon", "sucursal"}
+_NUMBER_RE = re.compile(r"\b\d+\b")
+
+# Offsets to the cell itself and half of its neighbours; the other half is covered from the other side
+_HALF_NEIGHBOURHOOD = [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+def similarity(a, b):
+    """Trigram Jaccard similarity of two folded strings, 0..1."""
+    if not a or not b:
+        return 0.0
+    ta, tb = _trigrams(a), _trigrams(b)
+    return len(ta & tb) / len(ta | tb)
+
+
+def block_keys(name):
+    """Name tokens that identify a place, plus a prefix of the spaceless name ("mcdo" for "Mc Donald's")."""
+    toks = [t for t in name.split() if len(t) >= 3 and t not in STOPWORDS and not t.isdigit()]
+    compact = name.replace(" ", "")
+    return set(toks) | ({compact[:4]} if len(compact) >= 4 else set())
+
+
+def _folded(df, col):
+    return fold_series(df[col]) if col in df.columns else pd.Series("", index=df.index)
+
+
+def _frame_keys(names, addrs):
+    """(pos, key) rows: name keys, plus the whole address ("@...") for matching leads without coordinates."""
+    by_name = pd.DataFrame({"pos": np.arange(len(names)), "key": names.map(block_keys).to_numpy()}).explode("key")
+    has_addr = (addrs != "").to_numpy()
+    by_addr = pd.DataFrame({"pos": np.flatnonzero(has_addr), "key": "@" + addrs[has_addr].to_numpy(dtype=object)})
+    return pd.concat([by_name.dropna(), by_addr], ignore_index=True)
+
+
+def _cells(df):
+    lats = df["latitude"].to_numpy(dtype=np.float64, na_value=np.nan)
+    lons = df["longitude"].to_numpy(dtype=np.float64, na_value=np.nan)
+    has = ~(np.isnan(lats) | np.isnan(lons))
+    cy = np.where(has, np.floor(np.nan_to_num(lats) / CELL_DEG), 0).astype(np.int64)
+    cx = np.where(has, np.floor(np.nan_to_num(lons) / CELL_DEG), 0).astype(np.int64)
+    return lats, lons, has, cy, cx
+
+
+def text_block(search_index, name, address=""):
+    """lead_ids a lead without coordinates can pair with, looked up in the search index
+    instead of folding every lead: those with a word starting with one of its name block
+    keys, and those with the rarest word of its address. Like _name_pairs, keys shared by
+    more than MAX_TOKEN_BLOCK leads are skipped."""
+    ids = set()
+    for key in block_keys(fold(name)):
+        found = search_index.postings(key)
+        if len(found) <= MAX_TOKEN_BLOCK:
+            ids |= found
+    by_word = [search_index.postings(word) for word in fold(address).split()]
+    rarest = min(by_word, key=len, default=set())
+    if len(rarest) <= MAX_TOKEN_BLOCK:
+        ids |= rarest
+    return ids
+
+
+def _around(df, only, text_candidates=None):
+    """Row positions that can pair with the only lead_ids: the leads in the cells around
+    them and, for those without coordinates, text_candidates (every lead if not given)."""
+    _, _, has, cy, cx = _cells(df)
+    pos = df.index.get_indexer(list(only))
+    pos = pos[pos >= 0]
+    if not has[pos].all() and text_candidates is None:
+        return np.arange(len(df))
+    located = pos[has[pos]]
+    wanted = {(y + dy, x + dx) for y, x in zip(cy[located], cx[located]) for dy in (-1, 0, 1) for dx in (-1, 0, 1)}
+    near = pd.MultiIndex.from_arrays([cy, cx]).isin(list(wanted)) & has
+    if not has[pos].all():
+        near |= df.index.isin(list(text_candidates))
+    near[pos] = True
+    return np.flatnonzero(near)
+
+
+def _geo_pairs(df, keys, only):
+    """(pos_a, pos_b) of leads in neighbouring cells sharing a block key."""
+    lats, lons, has, cy, cx = _cells(df)
+    cells = pd.DataFrame({"pos": np.flatnonzero(has), "cy": cy[has], "cx": cx[has]})
+    keyed = keys[~keys["key"].str.startswith("@")].merge(cells, on="pos")
+    left = keyed if only is None else keyed[keyed["pos"].isin(only)]
+    parts = []
+    for dy, dx in _HALF_NEIGHBOURHOOD:
+        shifted = left.assign(cy=left["cy"] + dy, cx=left["cx"] + dx)
+        pairs = shifted.merge(keyed, on=["cy", "cx", "key"], suffixes=("_a", "_b"))[["pos_a", "pos_b"]]
+        if only is not None and (dy, dx) != (0, 0):
+            # Restricted to some leads, the other half of the neighbourhood has to be looked at from their side too
+            back = left.assign(cy=left["cy"] - dy, cx=left["cx"] - dx)
+            pairs = pd.concat([pairs, back.merge(keyed, on=["cy", "cx", "key"], suffixes=("_a", "_b"))[["pos_a", "pos_b"]]])
+        parts.append(pairs)
+    pairs = pd.concat(parts).to_numpy()
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    pairs.sort(axis=1)
+    pairs = np.unique(pairs, axis=0) if len(pairs) else pairs.reshape(0, 2)
+    dist = haversine_km(lats[pairs[:, 0]], lons[pairs[:, 0]], lats[pairs[:, 1]], lons[pairs[:, 1]]) * 1000
+    keep = dist <= MAX_DISTANCE_M
+    return pairs[keep], dist[keep], has
+
+
+def _name_pairs(keys, has, only):
+    """(pos_a, pos_b) pairing each lead without coordinates with any lead sharing one of its rarer keys."""
+    sizes = keys["key"].map(keys["key"].value_counts())
+    keys = keys[sizes.to_numpy() <= MAX_TOKEN_BLOCK]
+    left = keys[~has[keys["pos"].to_numpy()]]
+    if only is not None:
+        left = left[left["pos"].isin(only)]
+    pairs = left.merge(keys, on="key", suffixes=("_a", "_b"))[["pos_a", "pos_b"]].to_numpy()
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    pairs.sort(axis=1)
+    return np.unique(pairs, axis=0) if len(pairs) else pairs.reshape(0, 2)
+
+
+def find_duplicates(df, only=None, min_score=MIN_SCORE, text_candidates=None):
+    """Likely duplicate pairs, best first, as a frame of lead_a, lead_b, score, name_sim, address_sim, distance_m.
+
+    Candidates must share a name block key and either lie within MAX_DISTANCE_M
+    of each other (through the cell blocking) or, for leads without
+    coordinates, share a key that isn't too common. Only those pairs are
+    scored, so the cost grows with the number of leads, not its square.
+    only restricts the search to pairs involving those lead_ids; text_candidates
+    (see text_block) then stands in for the whole frame as the other side of
+    the ones without coordinates.
+    """
+    columns = ["lead_a", "lead_b", "score", "name_sim", "address_sim", "distance_m"]
+    if df.empty or "latitude" not in df.columns:
+        return pd.DataFrame(columns=columns)
+    only_pos = None
+    if only is not None:
+        df = df.iloc[_around(df, only, text_candidates)]
+        only_pos = df.index.get_indexer(list(only))
+    names, addrs = _folded(df, "Nombre del Local"), _folded(df, "Dirección")
+    keys = _frame_keys(names, addrs)
+    geo_pairs, dist, has = _geo_pairs(df, keys, only_pos)
+    text_pairs = _name_pairs(keys, has, only_pos)
+
+    names, addrs = names.to_numpy(), addrs.to_numpy()
+    place_ids = df["place_id"].to_numpy() if "place_id" in df.columns else np.full(len(df), None)
+    rows = []
+    for (a, b), d in zip(np.concatenate([geo_pairs, text_pairs]), np.concatenate([dist, np.full(len(text_pairs), np.nan)])):
+        score, name_sim, addr_sim = score_pair(names[a], names[b], addrs[a], addrs[b], d, place_ids[a], place_ids[b], min_score)
+        if score >= min_score:
+            rows.append((df.index[a], df.index[b], round(score, 3), round(name_sim, 3),
+                         None if addr_sim is None else round(addr_sim, 3), None if np.isnan(d) else round(float(d), 1)))
+    result = pd.DataFrame(rows, columns=columns)
+    return result.sort_values("score", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def score_pair(name_a, name_b, addr_a, addr_b, distance_m, place_a, place_b, min_score=0.0):
+    """(score, name similarity, address similarity or None) for two folded leads.
+
+    A weighted mean of the signals both leads have. Different street numbers, or
+    two different Google place ids, count against it: those are usually
+    branches, not duplicates. Gives up early (score 0) once min_score is out of reach.
+    """
+    if isinstance(place_a, str) and place_a == place_b:
+        return 1.0, similarity(name_a, name_b), None
+    name_sim = similarity(name_a, name_b)
+    if WEIGHTS["name"] * name_sim + 1.0 - WEIGHTS["name"] < min_score:
+        return 0.0, name_sim, None
+    signals = {"name": name_sim}
+    addr_sim = None
+    if addr_a and addr_b:
+        addr_sim = signals["address"] = similarity(addr_a, addr_b)
+    if not np.isnan(distance_m):
+        signals["distance"] = max(0.0, 1.0 - distance_m / MAX_DISTANCE_M)
+    score = sum(WEIGHTS[k] * v for k, v in signals.items()) / sum(WEIGHTS[k] for k in signals)
+    nums_a, nums_b = set(_NUMBER_RE.findall(addr_a or "")), set(_NUMBER_RE.findall(addr_b or ""))
+    if nums_a and nums_b and not nums_a & nums_b:
+        score *= 0.6
+    if isinstance(place_a, str) and isinstance(place_b, str):
+        score *= 0.7
+    return score, name_sim, addr_sim
+
+
+def _blank(value):
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return True
+    return str(value).strip() in ("", "nan", "No especificado") or (isinstance(value, (int, float, np.number)) and value == 0)
+
+
+def merged_fields(keep, drop):
+    """Fields to set on the kept lead (a row) so nothing the dropped one knew is lost.
+
+    Empty fields are filled from drop, the further-along Status and the higher
+    Priority win, and differing Notas are joined. The parsed opening hours follow
+    whichever Horario is kept, never a mix of both leads.
+    """
+    fields = {}
+    for col, value in drop.items():
+        if col in keep.index and col not in HOURS_COLUMNS and _blank(keep[col]) and not _blank(value):
+            fields[col] = value
+    if "Horario" in fields:
+        fields.update(hours_fields(fields["Horario"]))
+    if "Status" in keep.index:
+        rank = {s: i for i, s in enumerate(STATUS_OPTIONS)}
+        if rank.get(drop["Status"], -1) > rank.get(keep["Status"], -1):
+            fields["Status"] = drop["Status"]
+    if "Priority" in keep.index and not _blank(drop["Priority"]) and (_blank(keep["Priority"]) or drop["Priority"] > keep["Priority"]):
+        fields["Priority"] = drop["Priority"]
+    if "Notas" in keep.index and not _blank(keep["Notas"]) and not _blank(drop["Notas"]) and keep["Notas"] != drop["Notas"]:
+        fields["Notas"] = f"{keep['Notas']} | {drop['Notas']}"
+    return {k: (v.item() if hasattr(v, "item") else v) for k, v in fields.items()}
+
+
+def choose_keep(df, lead_a, lead_b, history):
+    """(keep, drop): the lead with more notes/checklist history, then the one with a place id, then the older."""
+    def rank(lead_id):
+        place = df.at[lead_id, "place_id"] if "place_id" in df.columns else None
+        return (history.get(lead_id, 0), isinstance(place, str), -lead_id)
+    return (lead_a, lead_b) if rank(lead_a) >= rank(lead_b) else (lead_b, lead_a)
@@ -0,0 +1,82 @@
+"""Spatial helpers for the lead map: vectorized haversine and a grid index over lat/lon."""
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT = EARTH_RADIUS_KM * np.pi / 180.0
+# ~1.1 km of latitude per cell: a 2 km radius touches a 5x5 block of cells
+DEFAULT_CELL_DEG = 0.01
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; every argument may be a scalar or a NumPy array."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def bounding_box(lat, lon, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) enclosing a circle of radius_km around a point."""
+    dlat = radius_km / KM_PER_DEG_LAT
+    dlon = radius_km / (KM_PER_DEG_LAT * max(np.cos(np.radians(lat)), 1e-6))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+class GridIndex:
+    """Bucket index over point coordinates, built once per load.
+
+    Points are sorted by a row-major cell key, so the cells of one grid row
+    covering a bounding box are a single contiguous slice found with two
+    binary searches. Queries only compute exact distances for that slice.
+    Results are row *positions* into the arrays the index was built from.
+    """
+
+    def __init__(self, lats, lons, cell_deg=DEFAULT_CELL_DEG):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        self.cell_deg = cell_deg
+        self.n_cols = int(np.ceil(360.0 / cell_deg)) + 1
+        self.size = len(lats)
+
+        positions = np.flatnonzero(~(np.isnan(lats) | np.isnan(lons)))
+        keys = self.cell_keys(lats[positions], lons[positions])
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._pos = positions[order]
+        self._lat = lats[self._pos]
+        self._lon = lons[self._pos]
+
+    def _rows(self, lats):
+        return np.floor((np.asarray(lats) + 90.0) / self.cell_deg).astype(np.int64)
+
+    def _cols(self, lons):
+        return np.floor((np.asarray(lons) + 180.0) / self.cell_deg).astype(np.int64)
+
+    def cell_keys(self, lats, lons):
+        return self._rows(lats) * self.n_cols + self._cols(lons)
+
+    def _bbox_slice(self, min_lat, max_lat, min_lon, max_lon):
+        """Sorted-array indices of every point whose cell overlaps the box."""
+        rows = np.arange(self._rows(min_lat), self._rows(max_lat) + 1, dtype=np.int64)
+        col_lo, col_hi = self._cols(min_lon), self._cols(max_lon)
+        starts = np.searchsorted(self._keys, rows * self.n_cols + col_lo, side="left")
+        ends = np.searchsorted(self._keys, rows * self.n_cols + col_hi, side="right")
+        spans = [np.arange(a, b) for a, b in zip(starts, ends) if b > a]
+        return np.concatenate(spans) if spans else np.empty(0, dtype=np.int64)
+
+    def query_radius(self, lat, lon, radius_km):
+        """Sorted positions of the points within radius_km of (lat, lon)."""
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+        cand = self._bbox_slice(min_lat, max_lat, min_lon, max_lon)
+        if cand.size == 0:
+            return cand
+        clat, clon = self._lat[cand], self._lon[cand]
+        in_box = (clat >= min_lat) & (clat <= max_lat) & (clon >= min_lon) & (clon <= max_lon)
+        cand, clat, clon = cand[in_box], clat[in_box], clon[in_box]
+        dist = haversine_km(lat, lon, clat, clon)
+        return np.sort(self._pos[cand[dist <= radius_km]])
+
+    def radius_mask(self, lat, lon, radius_km):
+        """Boolean mask over the original rows, True for points inside the radius."""
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self.query_radius(lat, lon, radius_km)] = True
+        return mask
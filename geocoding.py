@@ -0,0 +1,182 @@
+"""Zone lookup for "¿En qué zona estás?": offline gazetteer, on-disk cache, then Nominatim."""
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+CACHE_FILE = 'geocode_cache.json'
+CACHE_TTL_SECONDS = 30 * 24 * 3600
+MISS_TTL_SECONDS = 24 * 3600          # forget "not found" answers sooner
+OFFLINE_TTL_SECONDS = 60              # after a network failure, skip Nominatim this long (not cached on disk)
+CACHE_MAX_ENTRIES = 2000
+NOMINATIM_MIN_DELAY_SECONDS = 1.0     # Nominatim usage policy: max 1 request/second
+QUERY_SUFFIX = ", Buenos Aires, Argentina"
+
+# Approximate centroids of CABA barrios and GBA partidos/localidades, keyed by normalized name
+GAZETTEER = {
+    # CABA
+    "agronomia": (-34.5925, -58.4925), "almagro": (-34.6090, -58.4210), "abasto": (-34.6040, -58.4110),
+    "balvanera": (-34.6090, -58.4030), "once": (-34.6090, -58.4060), "barracas": (-34.6450, -58.3830),
+    "belgrano": (-34.5627, -58.4583), "boedo": (-34.6300, -58.4170), "caballito": (-34.6186, -58.4406),
+    "chacarita": (-34.5880, -58.4540), "coghlan": (-34.5600, -58.4750), "colegiales": (-34.5740, -58.4500),
+    "constitucion": (-34.6270, -58.3830), "flores": (-34.6280, -58.4630), "floresta": (-34.6280, -58.4830),
+    "la boca": (-34.6345, -58.3631), "la paternal": (-34.5970, -58.4670), "liniers": (-34.6420, -58.5200),
+    "mataderos": (-34.6600, -58.5030), "monte castro": (-34.6190, -58.5040), "montserrat": (-34.6120, -58.3810),
+    "nueva pompeya": (-34.6500, -58.4200), "nunez": (-34.5440, -58.4650), "palermo": (-34.5781, -58.4265),
+    "palermo soho": (-34.5880, -58.4300), "palermo hollywood": (-34.5830, -58.4380),
+    "las canitas": (-34.5690, -58.4330), "parque avellaneda": (-34.6470, -58.4800),
+    "parque chacabuco": (-34.6360, -58.4380), "parque chas": (-34.5850, -58.4790),
+    "parque patricios": (-34.6370, -58.4000), "puerto madero": (-34.6118, -58.3620),
+    "recoleta": (-34.5875, -58.3974), "retiro": (-34.5920, -58.3750), "saavedra": (-34.5530, -58.4860),
+    "san cristobal": (-34.6240, -58.4020), "san nicolas": (-34.6030, -58.3810),
+    "microcentro": (-34.6037, -58.3816), "san telmo": (-34.6210, -58.3730),
+    "velez sarsfield": (-34.6310, -58.4920), "versalles": (-34.6310, -58.5220),
+    "villa crespo": (-34.5990, -58.4380), "villa del parque": (-34.6040, -58.4900),
+    "villa devoto": (-34.6010, -58.5130), "villa general mitre": (-34.6100, -58.4680),
+    "villa lugano": (-34.6770, -58.4740), "villa luro": (-34.6380, -58.5030),
+    "villa ortuzar": (-34.5800, -58.4680), "villa pueyrredon": (-34.5810, -58.5050),
+    "villa real": (-34.6190, -58.5250), "villa riachuelo": (-34.6900, -58.4700),
+    "villa santa rita": (-34.6150, -58.4810), "villa soldati": (-34.6640, -58.4430),
+    "villa urquiza": (-34.5720, -58.4870), "caba": (-34.6037, -58.3816),
+    # Zona Norte
+    "vicente lopez": (-34.5250, -58.4800), "olivos": (-34.5080, -58.4880), "florida": (-34.5300, -58.4900),
+    "munro": (-34.5290, -58.5220), "villa martelli": (-34.5520, -58.5070), "la lucila": (-34.4990, -58.4820),
+    "carapachay": (-34.5270, -58.5350), "villa adelina": (-34.5170, -58.5450), "martinez": (-34.4925, -58.5050),
+    "san isidro": (-34.4708, -58.5286), "acassuso": (-34.4770, -58.5030), "beccar": (-34.4620, -58.5300),
+    "boulogne": (-34.5000, -58.5640), "san fernando": (-34.4420, -58.5600), "victoria": (-34.4540, -58.5480),
+    "tigre": (-34.4260, -58.5800), "don torcuato": (-34.4930, -58.6270), "nordelta": (-34.4050, -58.6470),
+    "pilar": (-34.4587, -58.9140), "escobar": (-34.3480, -58.7960),
+    # Zona Oeste
+    "san martin": (-34.5750, -58.5370), "villa ballester": (-34.5480, -58.5570), "caseros": (-34.6050, -58.5630),
+    "ramos mejia": (-34.6410, -58.5650), "san justo": (-34.6810, -58.5620), "moron": (-34.6530, -58.6190),
+    "haedo": (-34.6440, -58.5930), "castelar": (-34.6520, -58.6440), "ituzaingo": (-34.6580, -58.6670),
+    "hurlingham": (-34.5880, -58.6390), "san miguel": (-34.5430, -58.7120), "bella vista": (-34.5640, -58.6950),
+    "moreno": (-34.6500, -58.7900), "merlo": (-34.6650, -58.7270),
+    # Zona Sur
+    "avellaneda": (-34.6610, -58.3670), "lanus": (-34.7060, -58.3930), "lomas de zamora": (-34.7600, -58.4000),
+    "banfield": (-34.7440, -58.3940), "temperley": (-34.7720, -58.3960), "adrogue": (-34.8000, -58.3840),
+    "quilmes": (-34.7240, -58.2540), "bernal": (-34.7080, -58.2800), "berazategui": (-34.7640, -58.2110),
+    "monte grande": (-34.8160, -58.4680), "ezeiza": (-34.8540, -58.5230), "la plata": (-34.9210, -57.9550),
+}
+
+ALIASES = {
+    "vte lopez": "vicente lopez", "v lopez": "vicente lopez", "capital": "caba", "capital federal": "caba",
+    "ciudad de buenos aires": "caba", "centro": "microcentro", "obelisco": "microcentro",
+    "canitas": "las canitas", "devoto": "villa devoto", "urquiza": "villa urquiza", "pompeya": "nueva pompeya",
+    "ballester": "villa ballester", "lomas": "lomas de zamora", "paternal": "la paternal",
+}
+
+# Trailing context people add that doesn't change the zone
+_CONTEXT_SUFFIXES = ("argentina", "buenos aires", "bs as", "provincia de buenos aires", "gba", "caba")
+
+_lock = threading.Lock()
+_cache = None
+_client = None
+_offline_until = 0.0
+
+
+def normalize_query(text):
+    """Lowercase, accent-folded, punctuation-free form used as gazetteer and cache key."""
+    if not isinstance(text, str):
+        return ""
+    folded = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    folded = re.sub(r"[^a-z0-9,]+", " ", folded.lower())
+    return re.sub(r"\s+", " ", folded).strip(" ,")
+
+
+def _strip_context(norm):
+    parts = [p.strip() for p in norm.split(",") if p.strip()]
+    while len(parts) > 1 and parts[-1] in _CONTEXT_SUFFIXES:
+        parts.pop()
+    return ", ".join(parts)
+
+
+def lookup_gazetteer(norm):
+    """Offline answer for a normalized query, or None."""
+    norm = _strip_context(norm)
+    for key in (norm, norm.split(",")[0].strip(), re.sub(r"^(barrio|partido de|localidad de) ", "", norm)):
+        key = ALIASES.get(key, key)
+        if key in GAZETTEER:
+            return GAZETTEER[key]
+    return None
+
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        try:
+            with open(CACHE_FILE, encoding="utf-8") as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def _save_cache(cache):
+    if len(cache) > CACHE_MAX_ENTRIES:
+        # LRU eviction on last use
+        for key in sorted(cache, key=lambda k: cache[k]["used"])[:len(cache) - CACHE_MAX_ENTRIES]:
+            del cache[key]
+    tmp = f"{CACHE_FILE}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp, CACHE_FILE)
+    except OSError:
+        pass  # the cache is best-effort; a read-only disk just means more network calls
+
+
+def _get_client():
+    """Single rate-limited Nominatim client shared by every session of the process."""
+    global _client
+    if _client is None:
+        from geopy.extra.rate_limiter import RateLimiter
+        from geopy.geocoders import Nominatim
+        # No retries: geopy waits error_wait_seconds (5 s) before one, blocking the rerun, and
+        # min_delay_seconds already keeps us within the usage policy
+        _client = RateLimiter(Nominatim(user_agent="crm_agent", timeout=5).geocode,
+                              min_delay_seconds=NOMINATIM_MIN_DELAY_SECONDS, max_retries=0,
+                              error_wait_seconds=0, swallow_exceptions=False)
+    return _client
+
+
+def geocode_zone(query):
+    """(lat, lon) for a free-text zone, or None. Only cache misses hit the network, and not
+    for OFFLINE_TTL_SECONDS after it failed."""
+    global _offline_until
+    norm = normalize_query(query)
+    if not norm:
+        return None
+    hit = lookup_gazetteer(norm)
+    if hit:
+        return hit
+
+    now = time.time()
+    with _lock:
+        cache = _load_cache()
+        entry = cache.get(norm)
+        if entry is not None:
+            ttl = CACHE_TTL_SECONDS if entry["lat"] is not None else MISS_TTL_SECONDS
+            if now - entry["ts"] <= ttl:
+                entry["used"] = now
+                return (entry["lat"], entry["lon"]) if entry["lat"] is not None else None
+        if now < _offline_until:
+            return None
+
+    try:
+        loc = _get_client()(f"{_strip_context(norm)}{QUERY_SUFFIX}")
+    except Exception:
+        # Network failure, not a miss: don't cache the query, just leave the endpoint alone for a while
+        with _lock:
+            _offline_until = time.time() + OFFLINE_TTL_SECONDS
+        return None
+    coords = (loc.latitude, loc.longitude) if loc else None
+
+    with _lock:
+        cache = _load_cache()
+        cache[norm] = {"lat": coords[0] if coords else None, "lon": coords[1] if coords else None,
+                       "ts": now, "used": now}
+        _save_cache(cache)
+    return coords
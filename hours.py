@@ -0,0 +1,163 @@
+"""Opening hours parsed from the scraper's Horario text, and a per-weekday interval index over them.
+
+The scraper keeps Google's one-line status, not the weekly table: "Abre a las 7 p.m.",
+"Cierra a la 1 a.m.", "Abre a las 11 a.m. del lun", "5 p.m. · Vuelve a abrir a las 7:30 p.m.".
+Each line is reduced to an opening time, a closing time (minutes after midnight, either
+may be missing) and the weekday it applies to (missing = every day). When only one end
+is known the place is assumed to stay open OPEN_SPAN_MIN on the other side of it.
+"""
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from textnorm import fold_series
+
+HOURS_COLUMNS = ["opens_min", "closes_min", "hours_day"]
+DAY_MIN = 24 * 60
+OPEN_SPAN_MIN = 6 * 60         # assumed opening length when the status line gives only one end
+NIGHT_CUTOFF_MIN = 6 * 60      # a closing time up to 6 a.m. is past midnight of the day it opened
+DEFAULT_TZ = "America/Argentina/Buenos_Aires"
+WEEKDAYS = ["lun", "mar", "mie", "jue", "vie", "sab", "dom"]
+
+# On folded text ("abre a las 7 30 p m del mie")
+_TIME = r"(\d{1,2})(?: (\d{2}))? ([ap]) m"
+_DAY = r"(?: del? (" + "|".join(WEEKDAYS) + r"))?"
+_OPENS_RE = r"(?:^| )abre a las? " + _TIME + _DAY
+_REOPENS_RE = r"vuelve a abrir a las? " + _TIME
+_CLOSES_RE = r"(?:^| )cierra a las? " + _TIME + _DAY
+_BARE_CLOSE_RE = r"^" + _TIME      # "5 p.m.": Google's "Cierra pronto" label lives in another column
+_ALL_DAY_RE = r"24 horas"
+
+
+def _minutes(parts):
+    """Minutes after midnight from (hour, minute, a/p) extract columns; NaN where there was no match."""
+    hour = pd.to_numeric(parts[0], errors="coerce") % 12 + np.where(parts[2] == "p", 12, 0)
+    return (hour * 60 + pd.to_numeric(parts[1], errors="coerce").fillna(0)).to_numpy(dtype=np.float64)
+
+
+def parse_hours(values):
+    """Frame of opens_min, closes_min (Int16) and hours_day (Int8, 0 = Monday) per Horario text."""
+    text = fold_series(values)
+    opens = text.str.extract(_OPENS_RE)
+    reopens = text.str.extract(_REOPENS_RE)
+    closes = text.str.extract(_CLOSES_RE)
+    bare = text.str.extract(_BARE_CLOSE_RE)
+    open_min = _minutes(opens)
+    open_min = np.where(np.isnan(open_min), _minutes(reopens), open_min)
+    close_min = _minutes(closes)
+    # A bare closing time is today's; it can't share a row with an opening on another weekday
+    bare_min = np.where(opens[3].isna().to_numpy(), _minutes(bare), np.nan)
+    close_min = np.where(np.isnan(close_min), bare_min, close_min)
+    all_day = text.str.contains(_ALL_DAY_RE, regex=True).to_numpy()
+    open_min[all_day], close_min[all_day] = 0, DAY_MIN
+    day = opens[3].fillna(closes[3]).map({d: i for i, d in enumerate(WEEKDAYS)})
+    return pd.DataFrame({"opens_min": pd.array(np.where(np.isnan(open_min), None, open_min), dtype="Int16"),
+                         "closes_min": pd.array(np.where(np.isnan(close_min), None, close_min), dtype="Int16"),
+                         "hours_day": pd.array(day.to_numpy(dtype=np.float64, na_value=np.nan), dtype="Int8")},
+                        index=values.index)
+
+
+def add_hours_fields(df, rows=None):
+    """(Re)parses Horario into HOURS_COLUMNS for the rows mask (every row if None), in place."""
+    for col in HOURS_COLUMNS:
+        if col not in df.columns:
+            df[col] = pd.array([pd.NA] * len(df), dtype="Int16" if col != "hours_day" else "Int8")
+    if "Horario" not in df.columns:
+        return
+    rows = np.ones(len(df), dtype=bool) if rows is None else rows
+    if rows.any():
+        parsed = parse_hours(df.loc[rows, "Horario"])
+        for col in HOURS_COLUMNS:
+            df.loc[rows, col] = parsed[col].to_numpy()
+
+
+def hours_fields(horario):
+    """HOURS_COLUMNS of one Horario text, as plain values, for single-lead edits."""
+    parsed = parse_hours(pd.Series([horario], dtype=object)).iloc[0]
+    return {col: None if pd.isna(parsed[col]) else int(parsed[col]) for col in HOURS_COLUMNS}
+
+
+def local_now():
+    """Now in the leads' timezone (CRM_TZ, Buenos Aires by default), not the server's."""
+    try:
+        from zoneinfo import ZoneInfo
+        return datetime.now(ZoneInfo(os.environ.get("CRM_TZ", DEFAULT_TZ)))
+    except Exception:
+        return datetime.now()  # no tz database: assume the server runs on local time
+
+
+def _intervals(opens, closes):
+    """(row, start, end, start_known) in minutes of the lead's day; end may run past midnight."""
+    has_open, has_close = ~np.isnan(opens), ~np.isnan(closes)
+    close_end = np.where(closes <= NIGHT_CUTOFF_MIN, closes + DAY_MIN, closes)
+    parts = []
+    # Both ends, in order (also "24 horas"): one interval
+    whole = has_open & has_close & (close_end > opens) & ~((closes < opens) & (closes > NIGHT_CUTOFF_MIN))
+    parts.append((np.flatnonzero(whole), opens[whole], close_end[whole], True))
+    # A known opening: from it, for OPEN_SPAN_MIN (also the reopening after a split shift)
+    only_open = has_open & ~whole
+    parts.append((np.flatnonzero(only_open), opens[only_open], opens[only_open] + OPEN_SPAN_MIN, True))
+    # A known closing: the OPEN_SPAN_MIN before it
+    only_close = has_close & ~whole
+    parts.append((np.flatnonzero(only_close), close_end[only_close] - OPEN_SPAN_MIN, close_end[only_close], False))
+    rows = np.concatenate([p[0] for p in parts])
+    starts = np.concatenate([p[1] for p in parts])
+    ends = np.concatenate([p[2] for p in parts])
+    known = np.concatenate([np.full(len(p[0]), p[3]) for p in parts])
+    return rows, starts, ends, known
+
+
+class HoursIndex:
+    """Opening intervals of every lead, bucketed by the weekday they start on.
+
+    Each bucket is sorted by start minute, so "open at t" is a prefix found by
+    binary search plus the previous day's intervals that run past midnight, and
+    "opens within the next hour" is a binary-searched range. Results are row
+    positions into the frame the index was built from, as boolean masks.
+    """
+
+    def __init__(self, opens, closes, days):
+        opens = np.asarray(opens, dtype=np.float64)
+        closes = np.asarray(closes, dtype=np.float64)
+        days = np.asarray(days, dtype=np.float64)
+        self.size = len(opens)
+        rows, starts, ends, known = _intervals(opens, closes)
+        lead_days = days[rows]
+        # An interval pushed past midnight by the assumed span starts on the next day
+        shift = np.floor_divide(starts, DAY_MIN)
+        starts, ends = starts - shift * DAY_MIN, ends - shift * DAY_MIN
+        self._days = []
+        for weekday in range(7):
+            on_day = np.isnan(lead_days) | (((lead_days + shift) % 7) == weekday)
+            order = np.argsort(starts[on_day], kind="stable")
+            self._days.append(tuple(a[on_day][order] for a in (starts, ends, rows, known)))
+
+    @classmethod
+    def from_frame(cls, df):
+        cols = [df[c].to_numpy(dtype=np.float64, na_value=np.nan) if c in df.columns else np.full(len(df), np.nan)
+                for c in HOURS_COLUMNS]
+        return cls(*cols)
+
+    def open_mask(self, now):
+        """True for leads open at now (a datetime)."""
+        weekday, minute = now.weekday(), now.hour * 60 + now.minute
+        mask = np.zeros(self.size, dtype=bool)
+        starts, ends, rows, _ = self._days[weekday]
+        k = np.searchsorted(starts, minute, side="right")
+        mask[rows[:k][ends[:k] > minute]] = True
+        _, ends, rows, _ = self._days[(weekday - 1) % 7]
+        mask[rows[ends > minute + DAY_MIN]] = True
+        return mask
+
+    def opening_mask(self, now, within_min=60):
+        """True for leads with a known opening time in (now, now + within_min]."""
+        weekday, minute = now.weekday(), now.hour * 60 + now.minute
+        mask = np.zeros(self.size, dtype=bool)
+        for day, lo, hi in ((weekday, minute, minute + within_min),
+                            ((weekday + 1) % 7, minute - DAY_MIN, minute + within_min - DAY_MIN)):
+            starts, _, rows, known = self._days[day]
+            a, b = np.searchsorted(starts, [lo, hi], side="right")
+            mask[rows[a:b][known[a:b]]] = True
+        return mask
@@ -0,0 +1,261 @@
+"""Scraper export ingest: parsing done once per row and incremental, place-id keyed imports."""
+import glob
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from hours import HOURS_COLUMNS, add_hours_fields
+from textnorm import clean_text_series
+
+EXT_DATA = 'google.csv'
+EXPORTS_GLOB = os.path.join('exports', '*.csv')
+MANIFEST_FILE = 'import_manifest.json'
+CHUNK_ROWS = 5000
+# Bytes fingerprinted at the start of a file to tell "appended to" from "replaced"
+HEAD_BYTES = 4096
+
+COLUMN_MAPPING = {
+    'qBF1Pd': "Nombre del Local",
+    'W4Efsd': "Categoría",
+    'MW4etd': "Rating",
+    'UY7F9': "Cantidad de Reseñas",
+    'W4Efsd 4': "Dirección",
+    'W4Efsd 6': "Horario",
+    'ah5Ghc': "Reseña Destacada",
+    'hfpxzc href': "URL",
+    'A1zNzb href': "Website",
+    'J8zHNe': "Tiene_Pedido"
+}
+# Fields an import may fill on a lead we already have; CRM fields are never touched
+SYNC_COLUMNS = ["Website", "URL", "Horario", "Dirección", "Categoría", "Rating", "Tiene_Pedido"]
+# Scraped text shown as-is in the UI, cleaned once here instead of on every render
+TEXT_COLUMNS = ["Nombre del Local", "Categoría", "Dirección", "Horario", "Reseña Destacada", "Tiene_Pedido"]
+
+PLACE_COL = "place_id"
+COORD_COLS = ["latitude", "longitude"]
+
+# One pass over the Maps URL: feature id (!1s0x...:0x...) then coordinates (!3d<lat>!4d<lon>).
+# Both groups are optional so a URL missing one still yields the other.
+URL_FIELDS_RE = (r'^(?:.*?!1s(?P<place_id>0x[0-9a-fA-F]+:0x[0-9a-fA-F]+))?'
+                 r'(?:.*?!3d(?P<latitude>-?\d+(?:\.\d+)?)!4d(?P<longitude>-?\d+(?:\.\d+)?))?')
+
+
+def extract_url_fields(urls):
+    """Frame with place_id (str) and float32 latitude/longitude parsed from Google Maps URLs."""
+    parts = pd.Series(urls, dtype="object").fillna("").astype(str).str.extract(URL_FIELDS_RE)
+    parts[PLACE_COL] = parts[PLACE_COL].str.lower()
+    for col in COORD_COLS:
+        parts[col] = pd.to_numeric(parts[col], errors="coerce").astype(np.float32)
+    return parts
+
+
+def add_url_fields(df):
+    """Fills place_id/latitude/longitude from URL for rows without a place_id yet.
+
+    Returns a boolean mask of the rows that were filled, so callers can persist just those.
+    """
+    for col in [PLACE_COL] + COORD_COLS:
+        if col not in df.columns:
+            df[col] = np.nan
+    if df[PLACE_COL].dtype.kind == "f":
+        # An all-missing place_id column comes back from storage as float
+        df[PLACE_COL] = df[PLACE_COL].astype(object)
+    df[COORD_COLS] = df[COORD_COLS].astype(np.float32)
+    if "URL" not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    urls = df["URL"].fillna("").astype(str)
+    todo = (df[PLACE_COL].isna() & (urls != "")).to_numpy(copy=True)
+    if not todo.any():
+        return todo
+    parts = extract_url_fields(urls[todo])
+    found = (parts[PLACE_COL].notna() | parts["latitude"].notna()).to_numpy()
+    todo[todo] = found
+    parts = parts[found]
+    df.loc[todo, PLACE_COL] = parts[PLACE_COL].to_numpy()
+    # The URL is the source of truth for scraped coordinates; keep any we already had if it has none
+    has_coords = parts["latitude"].notna().to_numpy()
+    rows = np.flatnonzero(todo)[has_coords]
+    df.iloc[rows, [df.columns.get_loc(c) for c in COORD_COLS]] = parts.loc[has_coords, COORD_COLS].to_numpy()
+    return todo
+
+
+def export_paths():
+    """google.csv plus every scraper export dropped into exports/."""
+    paths = [EXT_DATA] if os.path.exists(EXT_DATA) else []
+    return paths + sorted(glob.glob(EXPORTS_GLOB))
+
+
+def _head_digest(path, length):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(min(length, HEAD_BYTES))).hexdigest()
+
+
+def load_manifest(path=MANIFEST_FILE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest, path=MANIFEST_FILE):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def pending_range(path, entry):
+    """(start_offset, header) still to read from path, or None if it was fully ingested.
+
+    An entry whose size shrank or whose leading bytes changed means the file was
+    replaced rather than appended to, so it is read again from the start.
+    """
+    size = os.path.getsize(path)
+    if entry:
+        offset = entry["offset"]
+        if size == offset and entry["head"] == _head_digest(path, offset):
+            return None
+        if size > offset and entry["head"] == _head_digest(path, offset):
+            return offset, entry["header"]
+    return 0, None
+
+
+def iter_export_chunks(path, offset=0, header=None, chunksize=CHUNK_ROWS):
+    """Streams a scraper export from a byte offset as renamed, parsed chunks."""
+    with open(path, "rb") as raw:
+        raw.seek(offset)
+        text = io.TextIOWrapper(raw, encoding="latin1", newline="")
+        read_kw = {"header": None, "names": header} if offset else {}
+        for chunk in pd.read_csv(text, chunksize=chunksize, dtype=str, **read_kw):
+            yield normalize_export_chunk(chunk.rename(columns=COLUMN_MAPPING))
+
+
+def read_header(path):
+    with open(path, encoding="latin1", newline="") as f:
+        return list(pd.read_csv(f, nrows=0).columns)
+
+
+def clean_text_columns(df):
+    """Cleans TEXT_COLUMNS in place (see textnorm.clean_text_series). Returns, per column,
+    the mask of rows that changed."""
+    dirty = {}
+    for col in TEXT_COLUMNS:
+        if col in df.columns:
+            values, dirty[col] = clean_text_series(df[col])
+            if dirty[col].any():
+                df[col] = values
+    return dirty
+
+
+def normalize_text_fields(df):
+    """Brings leads stored before ingest cleaned text and parsed hours up to date, in place.
+
+    Only rows with garbled text are touched, plus every row once if the hours
+    columns are missing. Returns a boolean mask of the rows to persist.
+    """
+    dirty = clean_text_columns(df)
+    changed = np.zeros(len(df), dtype=bool)
+    for mask in dirty.values():
+        changed |= mask
+    if all(col in df.columns for col in HOURS_COLUMNS):
+        reparse = dirty.get("Horario", np.zeros(len(df), dtype=bool))
+    else:
+        reparse = np.ones(len(df), dtype=bool)
+    add_hours_fields(df, reparse)
+    has_hours = np.zeros(len(df), dtype=bool)
+    for col in HOURS_COLUMNS:
+        has_hours |= df[col].notna().to_numpy()
+    return changed | (reparse & has_hours)
+
+
+def normalize_export_chunk(chunk):
+    """Adds place_id/coordinates, a numeric Rating, clean text and parsed hours; drops rows
+    with no place id."""
+    chunk = chunk.join(extract_url_fields(chunk["URL"] if "URL" in chunk else pd.Series(index=chunk.index)))
+    chunk = chunk[chunk[PLACE_COL].notna()].drop_duplicates(PLACE_COL)
+    if "Rating" in chunk.columns:
+        chunk["Rating"] = pd.to_numeric(chunk["Rating"].str.replace(",", ".", regex=False), errors="coerce")
+    clean_text_columns(chunk)
+    add_hours_fields(chunk)
+    return chunk
+
+
+def _is_empty(values):
+    text = values.astype(object).where(values.notna(), "").astype(str).str.strip()
+    return text.isin(["", "nan", "No especificado"]) | (values.astype(object) == 0)
+
+
+def upsert_chunk(df, chunk, defaults):
+    """Merges one export chunk into df by place_id.
+
+    Known places only get their empty SYNC_COLUMNS filled (as the old name-keyed
+    sync did), a filled Horario bringing its parsed HOURS_COLUMNS along; unknown places become new leads with the CRM defaults. Returns
+    (df, ids of updated leads, ids of inserted leads).
+    """
+    id_col = df.index.name
+    known = chunk[PLACE_COL].isin(df[PLACE_COL].dropna())
+    updated = set()
+    if known.any():
+        # Every lead carrying the place id, paired with the incoming row for it
+        pairs = (df.loc[df[PLACE_COL].isin(chunk.loc[known, PLACE_COL]), [PLACE_COL]]
+                 .reset_index().merge(chunk.loc[known], on=PLACE_COL, how="left"))
+        for col in SYNC_COLUMNS:
+            if col not in chunk.columns:
+                continue
+            incoming = pairs[col]
+            if col not in df.columns:
+                df[col] = pd.Series(np.nan, index=df.index, dtype=object)
+            elif df[col].dtype.kind == "f" and incoming.dtype.kind not in "fi":
+                # An all-empty text column comes back from storage as float
+                df[col] = df[col].astype(object)
+            current = df.loc[pairs[id_col], col].reset_index(drop=True)
+            fill = (_is_empty(current) & ~_is_empty(incoming)).to_numpy()
+            if fill.any():
+                ids = pairs.loc[fill, id_col].to_numpy()
+                df.loc[ids, col] = incoming[fill].to_numpy()
+                updated.update(ids.tolist())
+                if col == "Horario":
+                    add_hours_fields(df, np.zeros(len(df), dtype=bool))   # makes sure the columns exist
+                    for hours_col in HOURS_COLUMNS:
+                        df.loc[ids, hours_col] = pairs.loc[fill, hours_col].to_numpy()
+
+    new = chunk[~known]
+    if new.empty:
+        return df, sorted(updated), []
+    start = int(df.index.max()) + 1 if len(df) else 1
+    new = new.assign(**{k: v for k, v in defaults.items() if k not in new.columns})
+    new.index = pd.Index(np.arange(start, start + len(new)), name=df.index.name)
+    df = pd.concat([df, new]) if len(df) else new
+    return df, sorted(updated), new.index.tolist()
+
+
+def import_exports(df, defaults, paths=None, manifest=None):
+    """Streams every not-yet-ingested byte of the scraper exports into df.
+
+    Returns (df, updated_ids, inserted_ids, manifest). The manifest is only
+    returned, not saved: callers persist the leads first and the manifest last,
+    so an interrupted import is simply redone.
+    """
+    paths = export_paths() if paths is None else paths
+    manifest = dict(load_manifest() if manifest is None else manifest)
+    updated, inserted = set(), []
+    for path in paths:
+        key = os.path.normpath(path)
+        todo = pending_range(path, manifest.get(key))
+        if todo is None:
+            continue
+        offset, header = todo
+        size = os.path.getsize(path)
+        if header is None:
+            header = read_header(path)
+        for chunk in iter_export_chunks(path, offset, header):
+            df, upd, ins = upsert_chunk(df, chunk, defaults)
+            updated.update(upd)
+            inserted.extend(ins)
+        manifest[key] = {"offset": size, "header": header, "head": _head_digest(path, size)}
+    return df, sorted(updated - set(inserted)), inserted, manifest
@@ -0,0 +1,121 @@
+"""Building the leads frame from the store and the scraper exports, shared by the app and the CLI.
+
+Nothing here imports Streamlit, so batch jobs and benchmarks can load the same
+frame the app works on.
+"""
+import logging
+
+import pandas as pd
+
+from hours import HOURS_COLUMNS
+from ingest import (PLACE_COL, SYNC_COLUMNS, TEXT_COLUMNS, add_url_fields, export_paths, import_exports,
+                    normalize_text_fields, save_manifest)
+from schema import apply_schema
+from storage import _file_signature, ensure_lead_ids, load_snapshot, save_snapshot
+
+LEAD_DEFAULTS = {
+    "Status": "Por Contactar",
+    "Sistema": "Sin Dato",
+    "Asignado_A": "Sin Asignar",
+    "Notas": "",
+    "Priority": 0,
+    "Website": "",
+    "Horario": "",
+    "Dirección": "",
+    "Tiene_Pedido": ""
+}
+
+log = logging.getLogger(__name__)
+
+
+def _log(level, message):
+    log.log(logging.ERROR if level == "error" else logging.WARNING, message)
+
+
+def sources_signature(storage):
+    """What the frame is built from: the store plus every scraper export, as file signatures."""
+    return (storage.signature(), tuple((p, _file_signature(p)) for p in export_paths()))
+
+
+def build_db(storage, report=_log):
+    """(leads frame, lead_ids inserted by this run's import), from the store plus any new exports.
+
+    A store that can't be read or an export that can't be imported is passed to
+    report(level, message) ("error"/"warning") and the build goes on without it.
+    """
+    df = None
+
+    # 1. Load Primary Database (SQLite store or leads_db.csv)
+    try:
+        df = storage.load()
+    except Exception as e:
+        report("error", f"Error cargando base de datos: {e}")
+    if df is None:
+        df = ensure_lead_ids(pd.DataFrame(columns=["Nombre del Local", "Status", PLACE_COL]))
+
+    # 2. PLACE ID & COORDINATES: parsed from the Maps URL once, then persisted with the lead
+    parsed = add_url_fields(df)
+    # Text cleaned and Horario parsed at ingest; this catches leads stored before that (a no-op after)
+    normalized = normalize_text_fields(df)
+
+    # 3. IMPORT: stream only the not-yet-seen part of google.csv and exports/*.csv, upserting by
+    #    place id (not by name: branches of a chain share "Nombre del Local")
+    updated, inserted, manifest = [], [], None
+    try:
+        df, updated, inserted, manifest = import_exports(df, LEAD_DEFAULTS)
+    except Exception as e:
+        report("warning", f"Importando: {e}")
+
+    # 4. FIELD MAINTENANCE: Ensure all CRM columns exist
+    for col, default in LEAD_DEFAULTS.items():
+        if col not in df.columns:
+            df[col] = default
+        df[col] = df[col].fillna(default)
+
+    # 5. DATA CLEANING
+    if "Rating" in df.columns:
+        df["Rating"] = df["Rating"].astype(str).str.replace(',', '.', regex=False)
+        df["Rating"] = pd.to_numeric(df["Rating"], errors='coerce').fillna(0)
+
+    if "URL" in df.columns:
+        df["URL"] = df["URL"].fillna("").astype(str)
+
+    # Notes/checklist history: JSON cells for the CSV backend, event tables for SQLite
+    df = storage.migrate_legacy_columns(df)
+
+    # 6. TYPES: categoricals for the option fields, float32 coordinates, nullable ints
+    apply_schema(df)
+
+    if not storage.exists():
+        storage.save(df)
+    else:
+        changed = sorted(set(df.index[:len(parsed)][parsed | normalized]) | set(updated))
+        cols = [c for c in dict.fromkeys([PLACE_COL, "latitude", "longitude"] + SYNC_COLUMNS + TEXT_COLUMNS + HOURS_COLUMNS)
+                if c in df.columns]
+        storage.update_rows(df, changed, cols)
+        storage.insert_rows(df, inserted)
+    # Only mark the exports as ingested once their rows are safely stored
+    if storage.writer is not None:
+        storage.writer.flush()
+    if manifest is not None:
+        save_manifest(manifest)
+    return df, inserted
+
+
+def load_leads(storage, report=_log):
+    """The leads frame, from the Parquet snapshot when it matches the sources, else built and snapshotted.
+
+    Returns (df, lead_ids inserted by the import, signature of the sources it reflects).
+    The store adopts that signature, so it can refuse writes over a later change by someone else.
+    """
+    signature = sources_signature(storage)
+    df = load_snapshot(signature)
+    if df is not None:
+        storage.adopt(signature[0])
+        return df, [], signature
+    df, inserted = build_db(storage, report)
+    # build_db may have just created the store, so sign after building
+    signature = sources_signature(storage)
+    storage.adopt(signature[0])
+    save_snapshot(df, signature)
+    return df, inserted, signature
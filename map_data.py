@@ -0,0 +1,131 @@
+"""Map payload for the pydeck view: projected points, viewport culling and grid clusters."""
+import numpy as np
+import pandas as pd
+
+STATUS_COLORS = {
+    "Cliente": [0, 255, 128, 255],
+    "Visitado": [0, 128, 255, 255],
+    "Demo": [0, 128, 255, 255],
+    "Contactado": [255, 165, 0, 255],
+}
+DEFAULT_COLOR = [255, 80, 80, 255]
+CLUSTER_COLOR = [0, 0, 0, 200]
+
+CLUSTER_ZOOMS = range(4, 17)
+CLUSTER_CELL_PX = 60                 # one cluster per ~60x60 screen pixels
+MAX_VIEWPORT_POINTS = 1500           # above this many visible leads, cluster instead
+VIEWPORT_PX = (900, 520)             # assumed map size; pydeck doesn't report the real one back
+VIEWPORT_PAD = 1.5                   # send a margin around the view so small pans aren't empty
+OUTSIDE_ZOOM_STEP = 3                # leads outside the view are clustered this much coarser
+
+
+def status_colors(statuses):
+    """RGBA list per status, vectorized over a Series; a categorical is looked up once per category."""
+    if not isinstance(statuses.dtype, pd.CategoricalDtype):
+        return statuses.map(lambda s: STATUS_COLORS.get(s, DEFAULT_COLOR))
+    table = np.empty(len(statuses.cat.categories) + 1, dtype=object)
+    for i, status in enumerate(statuses.cat.categories):
+        table[i] = STATUS_COLORS.get(status, DEFAULT_COLOR)
+    table[-1] = DEFAULT_COLOR  # code -1: missing status
+    return pd.Series(table[statuses.cat.codes.to_numpy()], index=statuses.index)
+
+
+def cell_deg(zoom):
+    """Cluster cell size in degrees at a web-mercator zoom level."""
+    return 360.0 * CLUSTER_CELL_PX / (256.0 * 2 ** zoom)
+
+
+def precompute_cells(lats, lons):
+    """Per-zoom cluster cell key for every lead, computed once per load.
+
+    Returns {zoom: int64 array}; keys are -1 for leads without coordinates.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    valid = ~(np.isnan(lats) | np.isnan(lons))
+    cells = {}
+    for zoom in CLUSTER_ZOOMS:
+        size = cell_deg(zoom)
+        n_cols = int(np.ceil(360.0 / size)) + 1
+        keys = np.full(len(lats), -1, dtype=np.int64)
+        keys[valid] = (np.floor((lats[valid] + 90.0) / size).astype(np.int64) * n_cols
+                       + np.floor((lons[valid] + 180.0) / size).astype(np.int64))
+        cells[zoom] = keys
+    return cells
+
+
+def viewport_bounds(lat, lon, zoom, pad=VIEWPORT_PAD):
+    """(min_lat, max_lat, min_lon, max_lon) visible around a view center, with a margin."""
+    deg_per_px = 360.0 / (256.0 * 2 ** zoom)
+    half_w = VIEWPORT_PX[0] * deg_per_px * pad / 2.0
+    # Mercator stretches latitude by 1/cos(lat); shrink the vertical span accordingly
+    half_h = VIEWPORT_PX[1] * deg_per_px * np.cos(np.radians(lat)) * pad / 2.0
+    return lat - half_h, lat + half_h, lon - half_w, lon + half_w
+
+
+def _clamp_zoom(zoom):
+    return int(min(max(round(zoom), CLUSTER_ZOOMS.start), CLUSTER_ZOOMS.stop - 1))
+
+
+def _points(frame):
+    return pd.DataFrame({
+        "lead_id": frame.index.to_numpy(),
+        "latitude": frame["latitude"].to_numpy(dtype=np.float32),
+        "longitude": frame["longitude"].to_numpy(dtype=np.float32),
+        "color": status_colors(frame["Status"]).to_numpy(),
+        "name": frame["Nombre del Local"].astype(str).to_numpy(),
+        "status": frame["Status"].astype(str).to_numpy(),
+    })
+
+
+def _clusters(frame, keys):
+    """One row per cell: count, centroid and label, for cells with 2+ leads. Also returns singles."""
+    counts = pd.Series(keys).value_counts()
+    multi = counts.index[counts.to_numpy() > 1]
+    in_multi = np.isin(keys, multi)
+    agg = (pd.DataFrame({"cell": keys[in_multi],
+                         "latitude": frame["latitude"].to_numpy(dtype=np.float64)[in_multi],
+                         "longitude": frame["longitude"].to_numpy(dtype=np.float64)[in_multi]})
+           .groupby("cell").agg(latitude=("latitude", "mean"), longitude=("longitude", "mean"),
+                                count=("latitude", "size")).reset_index())
+    agg["latitude"] = agg["latitude"].astype(np.float32)
+    agg["longitude"] = agg["longitude"].astype(np.float32)
+    agg["radius"] = (8 + 4 * np.sqrt(agg["count"])).clip(upper=40).astype(np.int16)
+    agg["label"] = agg["count"].astype(str)
+    agg["name"] = agg["label"] + " locales"
+    agg["status"] = "Acercá el mapa para verlos"
+    agg["color"] = [CLUSTER_COLOR] * len(agg)
+    return agg.drop(columns="cell"), frame[~in_multi]
+
+
+def build_map_payload(view, positions, cells, lat, lon, zoom):
+    """(points, clusters) frames to draw for the filtered leads around a view center.
+
+    view is the filtered leads frame, positions its row positions in the full
+    frame (to look up the precomputed cells). Leads inside the padded viewport
+    are sent as points, or as clusters at the view's zoom if there are more
+    than MAX_VIEWPORT_POINTS of them. Leads outside are always clustered at a
+    coarser zoom, so panning still shows where the rest are.
+    """
+    coords = view[["latitude", "longitude"]].to_numpy(dtype=np.float64, na_value=np.nan)
+    has_coords = ~np.isnan(coords).any(axis=1)
+    min_lat, max_lat, min_lon, max_lon = viewport_bounds(lat, lon, zoom)
+    inside = (has_coords & (coords[:, 0] >= min_lat) & (coords[:, 0] <= max_lat)
+              & (coords[:, 1] >= min_lon) & (coords[:, 1] <= max_lon))
+    outside = has_coords & ~inside
+
+    point_parts, cluster_parts = [], []
+    if inside.sum() <= MAX_VIEWPORT_POINTS:
+        point_parts.append(view[inside])
+    else:
+        agg, singles = _clusters(view[inside], cells[_clamp_zoom(zoom)][positions[inside]])
+        cluster_parts.append(agg)
+        point_parts.append(singles)
+    if outside.any():
+        agg, singles = _clusters(view[outside], cells[_clamp_zoom(zoom - OUTSIDE_ZOOM_STEP)][positions[outside]])
+        cluster_parts.append(agg)
+        point_parts.append(singles)
+
+    points = _points(pd.concat(point_parts)) if point_parts else _points(view.iloc[:0])
+    clusters = pd.concat(cluster_parts, ignore_index=True) if cluster_parts else pd.DataFrame()
+    return points, clusters
@@ -0,0 +1,140 @@
+"""Pipeline counters per (grid cell, Status, Asignado_A, Sistema), kept in sync with single-lead edits.
+
+The counters answer whole-base totals and the neighbourhood blocks. A zone is
+counted from its already-filtered view with count_leads: the radius mask has
+visited its leads anyway, and counting them exactly is a single groupby.
+"""
+import threading
+from collections import Counter, defaultdict
+
+import numpy as np
+import pandas as pd
+
+from schema import STATUS_OPTIONS
+
+METRIC_COLUMNS = ["Status", "Asignado_A", "Sistema"]
+METRIC_FIELDS = METRIC_COLUMNS + ["latitude", "longitude"]   # an edit to any of these moves a lead's count
+CELL_DEG = 0.002           # ~220 m
+BLOCK_CELLS = 5            # neighbourhood table: blocks of 5x5 cells, ~1 km
+
+
+def _label(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    return str(value)
+
+
+class PipelineMetrics:
+    """Lead counts per grid cell and (Status, Asignado_A, Sistema).
+
+    Leads without coordinates are kept under the cell None: they count in the
+    totals but in no block. Queries walk the occupied cells, never the leads, and
+    add/remove keep the counts in sync with single-lead edits. Shared by every
+    session, hence the lock.
+    """
+
+    def __init__(self, cell_deg=CELL_DEG):
+        self.cell_deg = cell_deg
+        self._cells = defaultdict(Counter)    # (row, col) or None -> {(status, vendor, system): n}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df, cell_deg=CELL_DEG):
+        metrics = cls(cell_deg)
+        nan = np.full(len(df), np.nan)
+        lats = df["latitude"].to_numpy(dtype=np.float64, na_value=np.nan) if "latitude" in df.columns else nan
+        lons = df["longitude"].to_numpy(dtype=np.float64, na_value=np.nan) if "longitude" in df.columns else nan
+        has = ~(np.isnan(lats) | np.isnan(lons))
+        cy, cx = _cell_arrays(lats, lons, has, cell_deg)
+        keys = _labels(df).assign(has=has, cy=cy, cx=cx)
+        for (has_cell, cy, cx, *key), n in keys.groupby(["has", "cy", "cx"] + METRIC_COLUMNS, sort=False).size().items():
+            metrics._cells[(int(cy), int(cx)) if has_cell else None][tuple(key)] = int(n)
+        return metrics
+
+    def _cell(self, lat, lon):
+        if _label(lat) == "" or _label(lon) == "":
+            return None
+        return int(np.floor(float(lat) / self.cell_deg)), int(np.floor(float(lon) / self.cell_deg))
+
+    def add(self, values, n=1):
+        """Counts one lead, given its METRIC_FIELDS as a mapping."""
+        cell = self._cell(values.get("latitude"), values.get("longitude"))
+        key = tuple(_label(values.get(c)) for c in METRIC_COLUMNS)
+        with self._lock:
+            counter = self._cells[cell]
+            counter[key] += n
+            if counter[key] <= 0:
+                del counter[key]
+            if not counter:
+                del self._cells[cell]
+
+    def remove(self, values):
+        self.add(values, -1)
+
+    def counts(self):
+        """Status, Asignado_A, Sistema, n over every lead."""
+        total = Counter()
+        with self._lock:
+            for counter in self._cells.values():
+                total.update(counter)
+        return pd.DataFrame([(*key, n) for key, n in total.items()], columns=METRIC_COLUMNS + ["n"])
+
+    def blocks(self, block_cells=BLOCK_CELLS):
+        """latitude, longitude (block centre), Status, n for blocks of block_cells x block_cells cells."""
+        total = Counter()
+        with self._lock:
+            for cell, counter in self._cells.items():
+                if cell is None:
+                    continue
+                block = (cell[0] // block_cells, cell[1] // block_cells)
+                for (status, _, _), n in counter.items():
+                    total[block, status] += n
+        size = block_cells * self.cell_deg
+        return pd.DataFrame([((by + 0.5) * size, (bx + 0.5) * size, status, n) for ((by, bx), status), n in total.items()],
+                            columns=["latitude", "longitude", "Status", "n"])
+
+
+def _cell_arrays(lats, lons, has, cell_deg):
+    """Grid row and column per lead (0 where has is False)."""
+    cy = np.where(has, np.floor(np.nan_to_num(lats) / cell_deg), 0).astype(np.int64)
+    cx = np.where(has, np.floor(np.nan_to_num(lons) / cell_deg), 0).astype(np.int64)
+    return cy, cx
+
+
+def _labels(df):
+    """METRIC_COLUMNS of df as counter key labels (_label, vectorized)."""
+    labels = pd.DataFrame(index=range(len(df)))
+    for col in METRIC_COLUMNS:
+        if col in df.columns:
+            values = df[col].astype(object)
+            labels[col] = values.where(values.notna(), "").astype(str).to_numpy()
+        else:
+            labels[col] = ""
+    return labels
+
+
+def count_leads(df):
+    """Status, Asignado_A, Sistema, n over the leads of df, e.g. a zone's filtered view."""
+    counts = _labels(df).value_counts(sort=False)
+    return pd.DataFrame([(*key, int(n)) for key, n in counts.items()], columns=METRIC_COLUMNS + ["n"])
+
+
+def funnel(counts):
+    """Per Status in pipeline order: leads at that stage, leads that got at least that far,
+    and the % of the previous stage's that did."""
+    at_stage = counts.groupby("Status")["n"].sum().reindex(STATUS_OPTIONS, fill_value=0)
+    reached = at_stage[::-1].cumsum()[::-1]
+    step = (reached / reached.shift(1).replace(0, np.nan) * 100).round(1)
+    return pd.DataFrame({"leads": at_stage, "reached": reached, "step_pct": step})
+
+
+def leaderboard(counts, by="Asignado_A"):
+    """One row per value of by with its leads per Status, total and % Cliente; most clients first."""
+    if counts.empty:
+        return pd.DataFrame(columns=STATUS_OPTIONS + ["total", "client_pct"])
+    table = counts.pivot_table(index=by, columns="Status", values="n", aggfunc="sum", fill_value=0)
+    extra = [c for c in table.columns if c not in STATUS_OPTIONS]
+    table = table.reindex(columns=STATUS_OPTIONS + extra, fill_value=0)
+    table["total"] = table.sum(axis=1)
+    table["client_pct"] = (table["Cliente"] / table["total"] * 100).round(1)
+    return table.sort_values(["Cliente", "Demo", "total"], ascending=False)
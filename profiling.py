@@ -0,0 +1,124 @@
+"""Per-phase timings of each rerun, kept in memory and appended to a rotating JSONL log."""
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+TIMINGS_FILE = 'timings.jsonl'
+MAX_LOG_BYTES = 2 * 1024 * 1024
+LOG_BACKUPS = 3
+RECENT_RUNS = 50
+PERCENTILES = [0.5, 0.9, 0.99]
+
+
+class PhaseTimer:
+    """Wall time per named phase plus row counts/sizes for one rerun.
+
+    A phase entered more than once (e.g. several storage writes) accumulates.
+    """
+
+    def __init__(self, kind="app"):
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.counts = {}
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - t0) * 1000
+
+    def count(self, name, value):
+        self.counts[name] = int(value)
+
+    def record(self):
+        return {"ts": datetime.now().isoformat(timespec="seconds"), "kind": self.kind,
+                "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+                "phases": {k: round(v, 2) for k, v in self.phases.items()}, "counts": dict(self.counts)}
+
+
+class TimingLog:
+    """Last RECENT_RUNS records in memory, all of them in a size-rotated JSONL file.
+
+    Shared by every session of the process, hence the lock.
+    """
+
+    def __init__(self, path=TIMINGS_FILE, max_bytes=MAX_LOG_BYTES, backups=LOG_BACKUPS, recent=RECENT_RUNS):
+        self.path, self.max_bytes, self.backups = path, max_bytes, backups
+        self.recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def _rotate(self):
+        # timings.jsonl -> .1 -> .2 ...; the oldest backup is dropped
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.recent.append(record)
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+                    self._rotate()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError:
+                pass  # timings are best effort; never break a rerun over them
+
+    def files(self):
+        """Log files oldest first."""
+        backups = [f"{self.path}.{i}" for i in range(self.backups, 0, -1)]
+        return [p for p in backups + [self.path] if os.path.exists(p)]
+
+    def read_all(self):
+        return read_records(self.files())
+
+
+def read_records(paths):
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue  # a line cut short by a crash
+    return records
+
+
+def records_frame(records):
+    """One row per rerun: ts, kind, total_ms, one column per phase and per count."""
+    rows = [{"ts": r["ts"], "kind": r["kind"], "total_ms": r["total_ms"], **r["phases"],
+             **{f"n_{k}": v for k, v in r.get("counts", {}).items()}} for r in records]
+    return pd.DataFrame(rows)
+
+
+def summarize(records):
+    """p50/p90/p99/max/count in ms of the total and of each phase, slowest p90 first."""
+    frame = records_frame(records)
+    if frame.empty:
+        return pd.DataFrame()
+    cols = [c for c in frame.columns if c not in ("ts", "kind") and not c.startswith("n_")]
+    timings = frame[cols]
+    summary = timings.quantile(PERCENTILES).T
+    summary.columns = [f"p{int(q * 100)}" for q in PERCENTILES]
+    summary["max"] = timings.max()
+    summary["runs"] = timings.count()
+    return summary.round(1).sort_values("p90", ascending=False)
+
+
+if __name__ == "__main__":
+    # python profiling.py [timings.jsonl ...]: percentile summary of the logged reruns
+    paths = sys.argv[1:] or TimingLog().files()
+    print(summarize(read_records(paths)).to_string())
@@ -0,0 +1,137 @@
+"""Visit order for a set of leads: nearest neighbour, then 2-opt and Or-opt under a time budget."""
+import time
+
+import numpy as np
+
+from geo import haversine_km
+
+DEFAULT_TIME_BUDGET_S = 0.5
+MAX_ROUTE_STOPS = 300          # beyond this the matrix and the passes stop being interactive
+OR_OPT_SEGMENTS = (1, 2, 3)
+EPS = 1e-9
+
+
+def distance_matrix(lats, lons):
+    """Pairwise great-circle km, built in one broadcast."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    return haversine_km(lats[:, None], lons[:, None], lats[None, :], lons[None, :])
+
+
+def _with_anchor(dist):
+    """dist plus one extra node at zero distance from everything.
+
+    Routes are kept as anchor + ... + anchor: with the anchor at both ends the
+    closing edges are free, which turns the cycle heuristics into open-path ones.
+    """
+    n = len(dist)
+    ext = np.zeros((n + 1, n + 1))
+    ext[:n, :n] = dist
+    return ext, n
+
+
+def nearest_neighbour(dist, start):
+    """Greedy order starting at node start."""
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    order = [start]
+    visited[start] = True
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, dist[order[-1]])
+        nxt = int(np.argmin(row))
+        order.append(nxt)
+        visited[nxt] = True
+    return np.array(order)
+
+
+def route_length(route, dist):
+    return float(dist[route[:-1], route[1:]].sum())
+
+
+def two_opt(route, dist, lo, deadline):
+    """Best-improvement segment reversals; positions before lo and the last one stay put."""
+    improved = False
+    n = len(route)
+    for i in range(lo, n - 2):
+        if time.perf_counter() > deadline:
+            break
+        a, b = route[i - 1], route[i]
+        js = np.arange(i + 1, n - 1)
+        c, e = route[js], route[js + 1]
+        delta = dist[a, c] + dist[b, e] - dist[a, b] - dist[c, e]
+        best = int(np.argmin(delta))
+        if delta[best] < -EPS:
+            j = js[best]
+            route[i:j + 1] = route[i:j + 1][::-1]
+            improved = True
+    return improved
+
+
+def or_opt(route, dist, lo, deadline):
+    """Moves runs of 1-3 stops (possibly reversed) to the cheapest other gap."""
+    improved = False
+    for k in OR_OPT_SEGMENTS:
+        i = lo
+        while i + k < len(route):
+            if time.perf_counter() > deadline:
+                return improved
+            seg = route[i:i + k]
+            p, nx = route[i - 1], route[i + k]
+            gain = dist[p, seg[0]] + dist[seg[-1], nx] - dist[p, nx]
+            rest = np.concatenate([route[:i], route[i + k:]])
+            # Gaps (rest[t], rest[t + 1]) from position lo - 1 on, except the one the run came from
+            t = np.arange(lo - 1, len(rest) - 1)
+            t = t[t != i - 1]
+            u, v = rest[t], rest[t + 1]
+            base = dist[u, v]
+            fwd = dist[u, seg[0]] + dist[seg[-1], v] - base
+            rev = dist[u, seg[-1]] + dist[seg[0], v] - base
+            cost = np.minimum(fwd, rev)
+            best = int(np.argmin(cost)) if len(cost) else None
+            if best is not None and cost[best] - gain < -EPS:
+                at = t[best] + 1
+                piece = seg if fwd[best] <= rev[best] else seg[::-1]
+                route[:] = np.concatenate([rest[:at], piece, rest[at:]])
+                improved = True
+            else:
+                i += 1
+    return improved
+
+
+def plan_route(lats, lons, start=None, time_budget=DEFAULT_TIME_BUDGET_S):
+    """Near-shortest order to visit every (lat, lon) stop, as straight-line km.
+
+    start is an optional (lat, lon) the walk begins at (not revisited at the
+    end); without it the route may begin at any stop. Returns (order, km) where
+    order are positions into lats/lons.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n = len(lats)
+    if n == 0:
+        return np.array([], dtype=int), 0.0
+    deadline = time.perf_counter() + time_budget
+    if start is not None:
+        lats, lons = np.append(start[0], lats), np.append(start[1], lons)
+    dist, anchor = _with_anchor(distance_matrix(lats, lons))
+
+    if start is not None:
+        # Fixed first stop: anchor, start, ...tour..., anchor
+        body = nearest_neighbour(dist[:anchor, :anchor], 0)
+        lo = 2
+    else:
+        first = int(np.argmin(np.hypot(lats - lats.mean(), lons - lons.mean())))
+        body = nearest_neighbour(dist[:anchor, :anchor], first)
+        lo = 1
+    route = np.concatenate([[anchor], body, [anchor]])
+
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = two_opt(route, dist, lo, deadline)
+        improved = or_opt(route, dist, lo, deadline) or improved
+
+    order = route[1:-1]
+    km = route_length(order, dist)
+    if start is not None:
+        order = order[1:] - 1
+    return order, km
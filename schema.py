@@ -0,0 +1,56 @@
+"""Typed in-memory representation of the leads frame."""
+import numpy as np
+import pandas as pd
+
+STATUS_OPTIONS = ["Por Contactar", "Contactado", "Visitado", "Demo", "Cliente"]
+SYSTEM_OPTIONS = ["Sin Dato", "Fudo", "Bistrosoft", "BCN", "Otro"]
+VENDOR_OPTIONS = ["Sin Asignar", "Seba", "Facu"]
+
+# Low-cardinality text: the known options first, then whatever else is in the data
+CATEGORY_COLUMNS = {
+    "Status": STATUS_OPTIONS,
+    "Sistema": SYSTEM_OPTIONS,
+    "Asignado_A": VENDOR_OPTIONS,
+    "Categoría": [],
+    "Tiene_Pedido": [],
+}
+FLOAT32_COLUMNS = ["latitude", "longitude", "Rating"]
+INT_COLUMNS = {"Priority": "Int16", "opens_min": "Int16", "closes_min": "Int16", "hours_day": "Int8"}
+
+
+def _categorical(values, known):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype(object)
+    seen = pd.unique(values.dropna())
+    extra = sorted(str(v) for v in seen if v not in set(known))
+    return pd.Categorical(values.where(values.isna(), values.astype(str)), categories=list(known) + extra)
+
+
+def apply_schema(df):
+    """Casts the known columns in place: categoricals, float32 and nullable ints. Returns df."""
+    for col, known in CATEGORY_COLUMNS.items():
+        if col in df.columns:
+            df[col] = _categorical(df[col], known)
+    for col in FLOAT32_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float32)
+    for col, dtype in INT_COLUMNS.items():
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").round().astype(dtype)
+    return df
+
+
+def make_room(df, fields):
+    """Adds any new values in fields to the categories of their columns, so assigning them works."""
+    for col, val in fields.items():
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            if isinstance(val, str) and val not in df[col].cat.categories:
+                df[col] = df[col].cat.add_categories([val])
+
+
+def contains_mask(values, pattern):
+    """Case-insensitive substring match as a NumPy mask; a categorical is matched once per category."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        hits = values.cat.categories.astype(str).str.contains(pattern, case=False, regex=False)
+        return np.asarray(hits, dtype=bool)[values.cat.codes.to_numpy()] & (values.cat.codes.to_numpy() >= 0)
+    return values.astype(str).str.contains(pattern, case=False, regex=False, na=False).to_numpy()
@@ -0,0 +1,133 @@
+"""In-memory text index over lead name, address and category for the zone text fallback."""
+import bisect
+from collections import Counter, defaultdict
+
+from textnorm import tokens
+
+SEARCH_FIELDS = ["Nombre del Local", "Dirección", "Categoría"]
+FUZZY_MIN_LEN = 4          # shorter query tokens only match exactly or by prefix
+FUZZY_MIN_SIMILARITY = 0.45
+
+
+def _trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Accent-folded token index with prefix and trigram-fuzzy matching.
+
+    Every query token must match some token of a lead: exactly, as a prefix,
+    or by trigram similarity when nothing starts with it.
+    add/update/remove keep it in sync with single-lead edits.
+    """
+
+    def __init__(self):
+        self._doc_tokens = {}                 # lead_id -> set of tokens
+        self._postings = defaultdict(set)     # token -> lead_ids
+        self._vocab = []                      # sorted tokens, for prefix ranges
+        self._trigram_tokens = defaultdict(set)
+
+    @classmethod
+    def from_frame(cls, df, fields=SEARCH_FIELDS):
+        index = cls()
+        cols = [c for c in fields if c in df.columns]
+        for lead_id, *values in df[cols].itertuples():
+            index.add(lead_id, values)
+        return index
+
+    def __len__(self):
+        return len(self._doc_tokens)
+
+    def add(self, lead_id, texts):
+        toks = set()
+        for text in texts:
+            toks.update(tokens(text))
+        self._doc_tokens[lead_id] = toks
+        for tok in toks:
+            if tok not in self._postings:
+                bisect.insort(self._vocab, tok)
+                for tri in _trigrams(tok):
+                    self._trigram_tokens[tri].add(tok)
+            self._postings[tok].add(lead_id)
+
+    def remove(self, lead_id):
+        for tok in self._doc_tokens.pop(lead_id, ()):
+            ids = self._postings[tok]
+            ids.discard(lead_id)
+            if not ids:
+                del self._postings[tok]
+                del self._vocab[bisect.bisect_left(self._vocab, tok)]
+                for tri in _trigrams(tok):
+                    self._trigram_tokens[tri].discard(tok)
+
+    def update(self, lead_id, texts):
+        self.remove(lead_id)
+        self.add(lead_id, texts)
+
+    def postings(self, prefix):
+        """lead_ids with a word starting with prefix (folded)."""
+        lo = bisect.bisect_left(self._vocab, prefix)
+        hi = bisect.bisect_left(self._vocab, prefix + "\x7f")
+        return set().union(*(self._postings[tok] for tok in self._vocab[lo:hi]))
+
+    def _matches(self, qtok):
+        """(exact, prefix, fuzzy) token lists matching one query token."""
+        lo = bisect.bisect_left(self._vocab, qtok)
+        hi = bisect.bisect_left(self._vocab, qtok + "\x7f")
+        prefixed = self._vocab[lo:hi]
+        if prefixed or len(qtok) < FUZZY_MIN_LEN:
+            exact = [qtok] if prefixed and prefixed[0] == qtok else []
+            return exact, prefixed[len(exact):], []
+        qtris = _trigrams(qtok)
+        shared = defaultdict(int)
+        for tri in qtris:
+            for tok in self._trigram_tokens.get(tri, ()):
+                shared[tok] += 1
+        fuzzy = [tok for tok, n in shared.items()
+                 if n / (len(qtris) + len(_trigrams(tok)) - n) >= FUZZY_MIN_SIMILARITY]
+        return [], [], fuzzy
+
+    def search(self, query, limit=None):
+        """lead_ids matching every token of query, best first.
+
+        Ranked by how many query tokens matched a whole word, then by how few
+        needed a fuzzy match. The most selective query token is expanded first
+        and the others only filter it, so cost follows the result size rather
+        than the size of the posting lists.
+        """
+        groups = []
+        for qtok in tokens(query):
+            exact, prefix, fuzzy = self._matches(qtok)
+            sets = [self._postings[t] for t in exact + prefix + fuzzy]
+            if not sets:
+                return []
+            groups.append((sum(map(len, sets)), sets,
+                           self._postings[exact[0]] if exact else set(),
+                           [self._postings[t] for t in fuzzy]))
+        if not groups:
+            return []
+        groups.sort(key=lambda g: g[0])
+
+        matched = set().union(*groups[0][1])
+        for _, sets, _, _ in groups[1:]:
+            if len(sets) == 1:
+                matched &= sets[0]
+            else:
+                matched = {i for i in matched if any(i in s for s in sets)}
+            if not matched:
+                return []
+
+        # Tokens that matched all results exactly (or none of them) don't change the order
+        exact_hits, fuzzy_hits = Counter(), Counter()
+        for _, _, exact_ids, fuzzy_sets in groups:
+            hits = matched & exact_ids
+            if 0 < len(hits) < len(matched):
+                exact_hits.update(hits)
+            if fuzzy_sets:
+                fuzzy_hits.update(i for i in matched if any(i in s for s in fuzzy_sets))
+        if exact_hits or fuzzy_hits:
+            ranked = sorted(matched, key=lambda i: (-exact_hits[i], fuzzy_hits[i], i))
+        else:
+            ranked = sorted(matched)
+        return ranked[:limit] if limit else ranked
@@ -0,0 +1,661 @@
+"""Lead persistence backends.
+
+Both backends keep the leads frame indexed by a stable integer ``lead_id``
+and share one interface, so app.py and cli.py don't care which one is
+active:
+
+- ``SqliteStorage`` (default): WAL-mode SQLite, single-row UPDATE/INSERT per edit.
+  Notes and checklist ticks go to an append-only ``lead_events`` table with a
+  materialized ``checklist_state`` per lead.
+- ``CsvStorage``: the original leads_db.csv, rewritten on every change, with
+  notes and checklist kept as JSON in the Interaction_Log/Checklist cells.
+  Still used as the import/export format and for the one-shot migration.
+
+With a ``writer`` (writer.WriteBehind) attached, edits return as soon as the
+in-memory frame is updated: the SQL, or the CSV rewrite, is queued and bursts
+land together in one transaction or one atomic file replace. Reads don't wait
+for the queue: the SQLite backend lays its queued notes and checklist ticks
+over what the database returns (the CSV backend reads the frame itself). Bulk
+reads and writes (load, imports, merges, exports) flush the queue first, so
+they come after the session's own edits (unless the queue is failing, see
+writer.py; they don't wait on it then).
+
+Other processes (cli.py) may write the same store. ``adopt(signature)`` tells a
+backend which version of the store the caller's frame reflects; the CSV backend
+then refuses (StaleStoreError) to replace a file that has changed since, since
+a whole-file write would undo the other writer's edits. SQLite writes touch
+single rows and need no such guard.
+
+Select with the ``CRM_STORAGE`` environment variable ("sqlite" or "csv").
+
+Either way, the built frame is also kept as a Parquet snapshot so a restart with
+unchanged sources skips loading and parsing altogether.
+"""
+import io
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from schema import make_room
+
+DB_FILE = 'leads_db.csv'
+SQLITE_FILE = 'leads.db'
+SNAPSHOT_FILE = 'leads_snapshot.parquet'
+ID_COL = "lead_id"
+TABLE = "leads"
+CHECKLIST_COL = "Checklist"
+LOG_COL = "Interaction_Log"
+
+EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lead_events (
+    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    lead_id INTEGER NOT NULL,
+    ts TEXT NOT NULL,
+    author TEXT NOT NULL,
+    kind TEXT NOT NULL,      -- 'note' | 'checklist'
+    item TEXT,               -- checklist item, NULL for notes
+    value TEXT               -- note text, or '1'/'0' for checklist ticks
+);
+CREATE INDEX IF NOT EXISTS idx_lead_events_lead ON lead_events (lead_id, kind, event_id);
+CREATE TABLE IF NOT EXISTS checklist_state (
+    lead_id INTEGER NOT NULL,
+    item TEXT NOT NULL,
+    done INTEGER NOT NULL,
+    ts TEXT,
+    author TEXT,
+    PRIMARY KEY (lead_id, item)
+) WITHOUT ROWID;
+"""
+
+
+class StaleStoreError(RuntimeError):
+    """The store changed underneath a frame that would overwrite it whole."""
+
+
+def _file_signature(path):
+    """Cheap change detector for a file: (mtime_ns, size), or None if missing."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def ensure_lead_ids(df):
+    """Index the frame by lead_id, numbering rows that don't have one yet."""
+    if ID_COL in df.columns:
+        df = df.set_index(ID_COL)
+    elif df.index.name != ID_COL:
+        df = df.reset_index(drop=True)
+        df.index = df.index + 1
+    ids = pd.to_numeric(pd.Series(df.index, dtype="object"), errors="coerce")
+    missing = ids.isna().to_numpy()
+    if missing.any():
+        start = int(ids.max()) + 1 if ids.notna().any() else 1
+        ids[missing] = np.arange(start, start + missing.sum())
+    df.index = pd.Index(ids.astype("int64").to_numpy(), name=ID_COL)
+    return df
+
+
+def _is_text(frame):
+    return all(dtype == object for dtype in frame.dtypes)
+
+
+def _set_cells(frame, lead_ids, columns, values):
+    """Writes values (one row per lead_id, one column per column) into a text copy of the file,
+    adding the rows and columns it lacks; returns the frame."""
+    for col in columns:
+        if col not in frame.columns:
+            frame[col] = pd.Series("", index=frame.index, dtype=object)
+    new = [i for i in dict.fromkeys(lead_ids) if i not in frame.index]
+    if new:
+        frame = pd.concat([frame, pd.DataFrame("", index=pd.Index(new, name=ID_COL), columns=frame.columns, dtype=object)])
+    frame.loc[list(lead_ids), list(columns)] = np.asarray(values, dtype=object).reshape(len(lead_ids), len(columns))
+    return frame
+
+
+def _py(value):
+    """Plain Python value for sqlite3 parameters (NumPy scalars and NaN -> native/None)."""
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if value is pd.NA or value is pd.NaT:
+        return None
+    return value
+
+
+def append_row(df, lead_id, row):
+    """Appends row to df in place under lead_id, adding any columns it introduces."""
+    for col in row:
+        if col not in df.columns:
+            df[col] = np.nan
+    make_room(df, row)
+    df.loc[lead_id, list(row)] = [np.nan if v is None else v for v in row.values()]
+
+
+def _loads(raw, default):
+    try:
+        value = json.loads(raw) if isinstance(raw, str) and raw.strip() else default
+    except ValueError:
+        return default
+    return value if isinstance(value, type(default)) else default
+
+
+def _quote(col):
+    return '"' + str(col).replace('"', '""') + '"'
+
+
+class CsvStorage:
+    """leads_db.csv backend: every write rewrites the whole file.
+
+    An edit is queued as the change itself (cells, a new row, a deleted row),
+    not as a copy of the frame, so it costs the caller the same at any size. The
+    worker applies a batch of changes to its own all-text copy of the file (read
+    on first use, dropped on adopt() or a failed write) and writes it out once.
+    """
+
+    writer = None
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self._generation = 0        # bumped by adopt(); a change queued for an older frame is refused
+        self._expected = None       # file signature the frame was read from, or we last wrote
+        self._file_frame = None     # the worker's text copy of the file; None: read it on next write
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def signature(self):
+        return _file_signature(self.path)
+
+    def adopt(self, signature):
+        """Records that the caller's frame reflects the file as of signature (None: don't check)."""
+        self._generation += 1
+        self._expected = signature
+        self._file_frame = None
+
+    def load(self):
+        if self.writer is not None:
+            self.writer.flush()
+        if not self.exists():
+            return None
+        signature = self.signature()
+        df = ensure_lead_ids(pd.read_csv(self.path))
+        self.adopt(signature)
+        return df
+
+    def save(self, df):
+        """Full replace; the frame is copied now, as the caller goes on editing it. Only used for bulk writes."""
+        frame = df.copy()
+        self._change(lambda _: frame)
+
+    def _change(self, change):
+        """Queues change(text copy of the file) -> frame; runs it now without a writer."""
+        generation = self._generation
+
+        def op(frame):
+            if generation != self._generation:
+                raise StaleStoreError(f"{self.path} was reloaded after this change was made; make it again")
+            return change(frame)
+        if self.writer is None:
+            self.run_batch([op])
+        else:
+            self.writer.submit(op)
+
+    def _text(self, frame):
+        """frame, or the file read as text (every cell a str, blanks ""), which round-trips unchanged."""
+        if frame is not None and _is_text(frame):
+            return frame
+        if frame is not None:
+            # A typed frame from a save earlier in the batch: take it as the file would read back
+            return ensure_lead_ids(pd.read_csv(io.StringIO(frame.to_csv(index=True, index_label=ID_COL)),
+                                               dtype=object, keep_default_na=False))
+        if not self.exists():
+            return pd.DataFrame(index=pd.Index([], dtype="int64", name=ID_COL))
+        return ensure_lead_ids(pd.read_csv(self.path, dtype=object, keep_default_na=False))
+
+    def _set(self, lead_ids, columns, values):
+        self._change(lambda frame: _set_cells(self._text(frame), lead_ids, columns, values))
+
+    def run_batch(self, ops):
+        """Write-behind entry point: applies every queued change, then rewrites the file once."""
+        frame = self._file_frame
+        try:
+            for op in ops:
+                frame = op(frame)
+            self._write_file(frame)
+        except Exception:
+            self._file_frame = None     # may hold part of the batch: read the file again next time
+            raise
+        # A saved (typed) frame isn't kept: changes are applied to text, read back on first use
+        self._file_frame = frame if _is_text(frame) else None
+
+    def _write_file(self, frame):
+        """Writes a temp file next to the CSV and renames it over, so a crash never leaves half a file.
+
+        Refused if the file changed since the frame was read: someone else wrote
+        it, and replacing it would silently undo their edits.
+        """
+        if self._expected is not None and self.signature() != self._expected:
+            raise StaleStoreError(f"{self.path} changed on disk since it was read; reload before saving")
+        tmp = f"{self.path}.tmp"
+        frame.to_csv(tmp, index=True, index_label=ID_COL)
+        os.replace(tmp, self.path)
+        self._expected = self.signature()
+
+    def update_lead(self, df, lead_id, fields):
+        self._set([lead_id], list(fields), [list(fields.values())])
+
+    def update_rows(self, df, lead_ids, columns):
+        if len(lead_ids):
+            self._set(list(lead_ids), list(columns), df.loc[lead_ids, columns].astype(object).to_numpy())
+
+    def insert_rows(self, df, lead_ids):
+        if len(lead_ids):
+            self._set(list(lead_ids), list(df.columns), df.loc[lead_ids].astype(object).to_numpy())
+
+    def delete_lead(self, df, lead_id):
+        """df has already dropped the lead; its history goes with its row."""
+        self._change(lambda frame: self._text(frame).drop(index=lead_id, errors="ignore"))
+
+    def insert_lead(self, df, row):
+        """Appends row to df in place and returns its new lead_id."""
+        lead_id = int(df.index.max()) + 1 if len(df) else 1
+        append_row(df, lead_id, row)
+        self._set([lead_id], list(row), [list(row.values())])
+        return lead_id
+
+    # History lives in the legacy JSON cells, newest note first
+    def migrate_legacy_columns(self, df):
+        for col, default in ((CHECKLIST_COL, "{}"), (LOG_COL, "[]")):
+            if col not in df.columns:
+                df[col] = default
+            df[col] = df[col].fillna(default).astype(str)
+        return df
+
+    def add_note(self, df, lead_id, author, note, ts):
+        logs = _loads(df.at[lead_id, LOG_COL], [])
+        logs.insert(0, {"user": author, "date": ts, "note": note})
+        df.at[lead_id, LOG_COL] = json.dumps(logs)
+        self._set([lead_id], [LOG_COL], [[df.at[lead_id, LOG_COL]]])
+
+    def recent_notes(self, df, lead_id, limit=3):
+        logs = _loads(df.at[lead_id, LOG_COL], [])[:limit]
+        return [{"ts": l.get("date", ""), "author": l.get("user", ""), "note": l.get("note", "")} for l in logs]
+
+    def checklist(self, df, lead_id):
+        return {k: bool(v) for k, v in _loads(df.at[lead_id, CHECKLIST_COL], {}).items()}
+
+    def leads_with_item_done(self, df, item):
+        """Set of lead_ids whose checklist has item ticked."""
+        return {lead_id for lead_id, raw in df[CHECKLIST_COL].items() if _loads(raw, {}).get(item)}
+
+    def set_checklist_item(self, df, lead_id, item, done, author, ts):
+        state = _loads(df.at[lead_id, CHECKLIST_COL], {})
+        state[item] = bool(done)
+        df.at[lead_id, CHECKLIST_COL] = json.dumps(state)
+        self._set([lead_id], [CHECKLIST_COL], [[df.at[lead_id, CHECKLIST_COL]]])
+
+    def history_counts(self, df, lead_ids):
+        """{lead_id: notes + ticked checklist items}, to tell which of two duplicates has more history."""
+        return {lead_id: len(_loads(df.at[lead_id, LOG_COL], [])) + sum(map(bool, _loads(df.at[lead_id, CHECKLIST_COL], {}).values()))
+                for lead_id in lead_ids}
+
+    def merge_history(self, df, keep_id, drop_id):
+        """Moves drop_id's notes and checklist onto keep_id; a tick on either side stays ticked."""
+        logs = _loads(df.at[keep_id, LOG_COL], []) + _loads(df.at[drop_id, LOG_COL], [])
+        logs.sort(key=lambda l: str(l.get("date", "")), reverse=True)
+        state = _loads(df.at[drop_id, CHECKLIST_COL], {})
+        for item, done in _loads(df.at[keep_id, CHECKLIST_COL], {}).items():
+            state[item] = bool(done) or bool(state.get(item))
+        df.at[keep_id, LOG_COL] = json.dumps(logs)
+        df.at[keep_id, CHECKLIST_COL] = json.dumps(state)
+        self._set([keep_id], [LOG_COL, CHECKLIST_COL], [[df.at[keep_id, LOG_COL], df.at[keep_id, CHECKLIST_COL]]])
+
+    def recent_events(self, df, limit=50):
+        rows = []
+        for lead_id, raw in df[LOG_COL].items():
+            rows += [(lead_id, l.get("date", ""), l.get("user", ""), "note", None, l.get("note", ""))
+                     for l in _loads(raw, [])]
+        events = pd.DataFrame(rows, columns=[ID_COL, "ts", "author", "kind", "item", "value"])
+        return events.sort_values("ts", ascending=False).head(limit)
+
+    def export_frame(self, df):
+        return df
+
+
+class SqliteStorage:
+    """SQLite backend in WAL mode; edits touch only the rows they change."""
+
+    writer = None
+
+    def __init__(self, path=SQLITE_FILE):
+        self.path = path
+        self._schema_ready = False
+        self._unsaved = {}                  # queued op -> (lead_id, kind, value) until its transaction commits
+        self._unsaved_lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation keeps this safe across Streamlit session threads
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ready:
+                conn.executescript(EVENTS_SCHEMA)
+                self._schema_ready = True
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _drain(self):
+        """Waits for the queued edits (a no-op on the writer's own thread), so a bulk read or write comes after them."""
+        if self.writer is not None:
+            self.writer.flush()
+
+    def _write(self, op, unsaved=None):
+        """Runs op(conn) in a transaction now, or queues it for the write-behind worker.
+
+        unsaved, a (lead_id, kind, value) event, is what reads see of a queued op until it commits.
+        """
+        if self.writer is None:
+            with self._connect() as conn:
+                op(conn)
+            return
+        if unsaved is not None:
+            with self._unsaved_lock:
+                self._unsaved[op] = unsaved
+        self.writer.submit(op)
+
+    def _unsaved_events(self, kind, lead_id=None):
+        """Queued (lead_id, value) events of kind, oldest first. Taken before the database is
+        queried: an op that commits in between is then seen twice rather than missed."""
+        with self._unsaved_lock:
+            return [(l, v) for l, k, v in self._unsaved.values() if k == kind and (lead_id is None or l == lead_id)]
+
+    def run_batch(self, ops):
+        """Write-behind entry point: every queued op in a single transaction."""
+        with self._connect() as conn:
+            for op in ops:
+                op(conn)
+        with self._unsaved_lock:
+            for op in ops:
+                self._unsaved.pop(op, None)
+
+    def adopt(self, signature):
+        """Nothing to check: row-level writes can't undo another process's edits."""
+
+    def exists(self):
+        if not os.path.exists(self.path):
+            return False
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (TABLE,)).fetchone() is not None
+
+    def signature(self):
+        # Committed WAL frames change the -wal file before the main file is checkpointed
+        return (_file_signature(self.path), _file_signature(f"{self.path}-wal"))
+
+    def load(self):
+        if not self.exists():
+            return None
+        self._drain()
+        with self._connect() as conn:
+            df = pd.read_sql_query(f"SELECT * FROM {TABLE} ORDER BY {ID_COL}", conn, index_col=ID_COL)
+        df.index = df.index.astype("int64")
+        return df
+
+    def save(self, df):
+        """Full replace, in one transaction. Only used for bulk edits and imports."""
+        self._drain()
+        with self._connect() as conn:
+            df.to_sql(TABLE, conn, if_exists="replace", index=True, index_label=ID_COL,
+                      dtype={ID_COL: "INTEGER PRIMARY KEY"})
+
+    def _ensure_columns(self, conn, cols):
+        existing = {r[1] for r in conn.execute(f"PRAGMA table_info({TABLE})")}
+        for col in cols:
+            if col not in existing:
+                conn.execute(f"ALTER TABLE {TABLE} ADD COLUMN {_quote(col)}")
+
+    def update_lead(self, df, lead_id, fields):
+        cols = list(fields)
+        assignments = ", ".join(f"{_quote(c)} = ?" for c in cols)
+        params = [_py(v) for v in fields.values()] + [int(lead_id)]
+
+        def op(conn):
+            self._ensure_columns(conn, cols)
+            conn.execute(f"UPDATE {TABLE} SET {assignments} WHERE {ID_COL} = ?", params)
+        self._write(op)
+
+    def update_rows(self, df, lead_ids, columns):
+        """Writes df's values of columns for lead_ids, in one transaction."""
+        if len(lead_ids) == 0:
+            return
+        columns = list(columns)
+        self._drain()
+        values = df.loc[lead_ids, columns].astype(object).where(df.loc[lead_ids, columns].notna(), None)
+        params = [[_py(v) for v in row] + [int(lead_id)] for lead_id, row in zip(lead_ids, values.itertuples(index=False))]
+        assignments = ", ".join(f"{_quote(c)} = ?" for c in columns)
+        with self._connect() as conn:
+            self._ensure_columns(conn, columns)
+            conn.executemany(f"UPDATE {TABLE} SET {assignments} WHERE {ID_COL} = ?", params)
+
+    def insert_rows(self, df, lead_ids):
+        """Inserts the rows of df with the given lead_ids, in one transaction."""
+        if len(lead_ids) == 0:
+            return
+        rows = df.loc[lead_ids]
+        self._drain()
+        rows = rows.astype(object).where(rows.notna(), None)
+        cols = ", ".join([ID_COL] + [_quote(c) for c in rows.columns])
+        marks = ", ".join("?" for _ in range(len(rows.columns) + 1))
+        params = [[int(lead_id)] + [_py(v) for v in row] for lead_id, row in zip(lead_ids, rows.itertuples(index=False))]
+        with self._connect() as conn:
+            self._ensure_columns(conn, rows.columns)
+            conn.executemany(f"INSERT INTO {TABLE} ({cols}) VALUES ({marks})", params)
+
+    def delete_lead(self, df, lead_id):
+        """Deletes the lead row and its history."""
+        def op(conn):
+            for table in (TABLE, "lead_events", "checklist_state"):
+                conn.execute(f"DELETE FROM {table} WHERE {ID_COL} = ?", (int(lead_id),))
+        self._write(op)
+
+    def insert_lead(self, df, row):
+        """Inserts row, appends it to df in place and returns its new lead_id.
+
+        Written right away rather than queued: SQLite allocates the id inside the
+        INSERT, so it can't clash with a lead another process (cli.py) added.
+        """
+        cols = list(row)
+        names = ", ".join(_quote(c) for c in cols)
+        marks = ", ".join("?" for _ in cols)
+        self._drain()
+        with self._connect() as conn:
+            self._ensure_columns(conn, cols)
+            lead_id = conn.execute(f"INSERT INTO {TABLE} ({names}) VALUES ({marks})",
+                                   [_py(v) for v in row.values()]).lastrowid
+        append_row(df, lead_id, row)
+        return lead_id
+
+    def migrate_legacy_columns(self, df):
+        """Moves JSON Checklist/Interaction_Log cells into the event tables, once."""
+        legacy = [c for c in (CHECKLIST_COL, LOG_COL) if c in df.columns]
+        if not legacy:
+            return df
+        self._drain()
+        notes, ticks, states = [], [], []
+        for lead_id, raw in df.get(LOG_COL, pd.Series(dtype=object)).items():
+            # Stored newest first; append oldest first so event_id order matches time order
+            for entry in reversed(_loads(raw, [])):
+                notes.append((int(lead_id), str(entry.get("date", "")), str(entry.get("user", "")),
+                              "note", None, str(entry.get("note", ""))))
+        for lead_id, raw in df.get(CHECKLIST_COL, pd.Series(dtype=object)).items():
+            for item, done in _loads(raw, {}).items():
+                states.append((int(lead_id), item, int(bool(done)), "", ""))
+                if done:
+                    ticks.append((int(lead_id), "", "", "checklist", item, "1"))
+        with self._connect() as conn:
+            conn.executemany("INSERT INTO lead_events (lead_id, ts, author, kind, item, value) VALUES (?, ?, ?, ?, ?, ?)",
+                             notes + ticks)
+            conn.executemany("INSERT OR REPLACE INTO checklist_state VALUES (?, ?, ?, ?, ?)", states)
+            existing = {r[1] for r in conn.execute(f"PRAGMA table_info({TABLE})")}
+            for col in legacy:
+                if col in existing:
+                    conn.execute(f"ALTER TABLE {TABLE} DROP COLUMN {_quote(col)}")
+        return df.drop(columns=legacy)
+
+    def add_note(self, df, lead_id, author, note, ts):
+        self._write(lambda conn: conn.execute(
+            "INSERT INTO lead_events (lead_id, ts, author, kind, value) VALUES (?, ?, ?, 'note', ?)",
+            (int(lead_id), ts, author, note)),
+            unsaved=(int(lead_id), "note", {"ts": ts, "author": author, "note": note}))
+
+    def recent_notes(self, df, lead_id, limit=3):
+        queued = [note for _, note in self._unsaved_events("note", int(lead_id))]
+        with self._connect() as conn:
+            rows = conn.execute("SELECT ts, author, value FROM lead_events WHERE lead_id = ? AND kind = 'note' "
+                                "ORDER BY event_id DESC LIMIT ?", (int(lead_id), limit)).fetchall()
+        notes = [{"ts": ts, "author": author, "note": note} for ts, author, note in rows]
+        return ([n for n in reversed(queued) if n not in notes] + notes)[:limit]
+
+    def checklist(self, df, lead_id):
+        queued = self._unsaved_events("checklist", int(lead_id))
+        with self._connect() as conn:
+            rows = conn.execute("SELECT item, done FROM checklist_state WHERE lead_id = ?", (int(lead_id),)).fetchall()
+        state = {item: bool(done) for item, done in rows}
+        state.update(value for _, value in queued)
+        return state
+
+    def leads_with_item_done(self, df, item):
+        queued = self._unsaved_events("checklist")
+        with self._connect() as conn:
+            rows = conn.execute("SELECT lead_id FROM checklist_state WHERE item = ? AND done = 1", (item,)).fetchall()
+        done = {lead_id for (lead_id,) in rows}
+        for lead_id, (queued_item, ticked) in queued:
+            if queued_item == item:
+                (done.add if ticked else done.discard)(lead_id)
+        return done
+
+    def set_checklist_item(self, df, lead_id, item, done, author, ts):
+        def op(conn):
+            conn.execute("INSERT INTO lead_events (lead_id, ts, author, kind, item, value) VALUES (?, ?, ?, 'checklist', ?, ?)",
+                         (int(lead_id), ts, author, item, "1" if done else "0"))
+            conn.execute("INSERT OR REPLACE INTO checklist_state VALUES (?, ?, ?, ?, ?)",
+                         (int(lead_id), item, int(bool(done)), ts, author))
+        self._write(op, unsaved=(int(lead_id), "checklist", (item, bool(done))))
+
+    def history_counts(self, df, lead_ids):
+        ids = [int(i) for i in lead_ids]
+        if not ids:
+            return {}
+        queued = self._unsaved_events("note") + self._unsaved_events("checklist")
+        marks = ", ".join("?" for _ in ids)
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT lead_id, COUNT(*) FROM lead_events WHERE lead_id IN ({marks}) GROUP BY lead_id", ids).fetchall()
+        counts = dict(rows)
+        for lead_id, _ in queued:
+            if lead_id in ids:
+                counts[lead_id] = counts.get(lead_id, 0) + 1
+        return counts
+
+    def merge_history(self, df, keep_id, drop_id):
+        keep_id, drop_id = int(keep_id), int(drop_id)
+
+        def op(conn):
+            conn.execute("UPDATE lead_events SET lead_id = ? WHERE lead_id = ?", (keep_id, drop_id))
+            conn.execute("""INSERT INTO checklist_state (lead_id, item, done, ts, author)
+                            SELECT ?, item, done, ts, author FROM checklist_state WHERE lead_id = ? AND true
+                            ON CONFLICT (lead_id, item) DO UPDATE SET
+                                ts = CASE WHEN excluded.done > done THEN excluded.ts ELSE ts END,
+                                author = CASE WHEN excluded.done > done THEN excluded.author ELSE author END,
+                                done = MAX(done, excluded.done)""", (keep_id, drop_id))
+            conn.execute("DELETE FROM checklist_state WHERE lead_id = ?", (drop_id,))
+        self._write(op)
+        # A bulk move: let it land, so reads of keep_id see the history it took over
+        self._drain()
+
+    def recent_events(self, df, limit=50):
+        self._drain()
+        with self._connect() as conn:
+            return pd.read_sql_query(f"SELECT {ID_COL}, ts, author, kind, item, value FROM lead_events "
+                                     "ORDER BY event_id DESC LIMIT ?", conn, params=(limit,))
+
+    def export_frame(self, df):
+        """df with Checklist/Interaction_Log JSON cells rebuilt from the event tables."""
+        self._drain()
+        with self._connect() as conn:
+            notes = pd.read_sql_query(f"SELECT {ID_COL}, ts, author, value FROM lead_events "
+                                      "WHERE kind = 'note' ORDER BY event_id DESC", conn)
+            states = pd.read_sql_query(f"SELECT {ID_COL}, item, done FROM checklist_state", conn)
+        out = df.copy()
+        logs = {lid: json.dumps([{"user": a, "date": t, "note": v} for t, a, v in zip(g["ts"], g["author"], g["value"])])
+                for lid, g in notes.groupby(ID_COL)}
+        checklists = {lid: json.dumps({i: bool(d) for i, d in zip(g["item"], g["done"])})
+                      for lid, g in states.groupby(ID_COL)}
+        out[CHECKLIST_COL] = out.index.map(checklists).fillna("{}")
+        out[LOG_COL] = out.index.map(logs).fillna("[]")
+        return out
+
+
+def migrate_csv_to_sqlite(csv_path=DB_FILE, sqlite_path=SQLITE_FILE):
+    """One-shot import of an existing leads_db.csv into an empty SQLite store.
+
+    Returns the number of migrated leads, or None if there was nothing to do.
+    The CSV is left in place as a backup.
+    """
+    target = SqliteStorage(sqlite_path)
+    if target.exists() or not os.path.exists(csv_path):
+        return None
+    df = CsvStorage(csv_path).load()
+    target.save(df)
+    return len(df)
+
+
+def get_storage():
+    """Backend selected by CRM_STORAGE; SQLite is migrated from the CSV on first use."""
+    if os.environ.get("CRM_STORAGE", "sqlite").lower() == "csv":
+        return CsvStorage()
+    migrate_csv_to_sqlite()
+    return SqliteStorage()
+
+
+def save_snapshot(df, signature, path=SNAPSHOT_FILE):
+    """Writes df (dtypes included) as Parquet, tagged with the sources signature it reflects.
+
+    Skipped when pyarrow isn't available; it is an optional speed-up, not a store.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return False
+    table = pa.Table.from_pandas(df)
+    meta = {**(table.schema.metadata or {}), b"crm_signature": json.dumps(signature).encode()}
+    tmp = f"{path}.tmp"
+    pq.write_table(table.replace_schema_metadata(meta), tmp)
+    os.replace(tmp, path)
+    return True
+
+
+def load_snapshot(signature, path=SNAPSHOT_FILE):
+    """The snapshot frame if it was written for exactly these sources, else None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+        if (parquet.schema_arrow.metadata or {}).get(b"crm_signature") != json.dumps(signature).encode():
+            return None
+        # Arrow hands numeric and categorical columns over as read-only views; copy so in-place edits work
+        return parquet.read().to_pandas().copy()
+    except Exception:
+        return None  # missing pyarrow or a half-written/corrupt file: rebuild from the sources
@@ -0,0 +1,94 @@
+"""Balanced territories: capacity-constrained k-means over lead coordinates."""
+import numpy as np
+
+from geo import KM_PER_DEG_LAT
+
+MAX_ITERATIONS = 25
+
+
+def project_km(lats, lons):
+    """(n, 2) equirectangular x/y in km around the mean latitude; accurate enough at city scale."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    x = lons * np.cos(np.radians(lats.mean())) * KM_PER_DEG_LAT
+    return np.column_stack([x, lats * KM_PER_DEG_LAT])
+
+
+def capacities(n, weights):
+    """n split into integer shares proportional to weights (largest remainder), summing to n."""
+    weights = np.asarray(weights, dtype=np.float64)
+    exact = n * weights / weights.sum()
+    caps = np.floor(exact).astype(np.int64)
+    caps[np.argsort(caps - exact, kind="stable")[:n - caps.sum()]] += 1
+    return caps
+
+
+def _sq_dist(xy, centers):
+    return ((xy[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+
+
+def _seed(xy, k, rng):
+    """k-means++ starting centres."""
+    centers = [xy[rng.integers(len(xy))]]
+    for _ in range(1, k):
+        d = _sq_dist(xy, np.array(centers)).min(axis=1)
+        centers.append(xy[rng.choice(len(xy), p=d / d.sum())] if d.sum() > 0 else xy[rng.integers(len(xy))])
+    return np.array(centers)
+
+
+def assign(cost, caps):
+    """Labels giving each point the cheapest centre that still has room.
+
+    Points that lose the most by not getting their first choice go first. Round r
+    offers every still-unplaced point its r-th choice, and each centre takes
+    them in that order until it is full. Since caps sum to the number of points,
+    everyone is placed within k rounds.
+    """
+    n, k = cost.shape
+    prefs = np.argsort(cost, axis=1)
+    if k > 1:
+        ranked = np.take_along_axis(cost, prefs[:, :2], axis=1)
+        regret = ranked[:, 1] - ranked[:, 0]
+    else:
+        regret = np.zeros(n)
+    pending = np.argsort(-regret, kind="stable")
+    labels = np.full(n, -1, dtype=np.int64)
+    left = np.asarray(caps, dtype=np.int64).copy()
+    for rank in range(k):
+        choice = prefs[pending, rank]
+        placed = np.zeros(len(pending), dtype=bool)
+        for c in range(k):
+            take = np.flatnonzero(choice == c)[:left[c]]
+            labels[pending[take]] = c
+            left[c] -= len(take)
+            placed[take] = True
+        pending = pending[~placed]
+        if not len(pending):
+            break
+    return labels
+
+
+def partition(lats, lons, caps, seed=0, max_iterations=MAX_ITERATIONS):
+    """Territory label (0..len(caps)-1) per point, territory c getting exactly caps[c] points.
+
+    Lloyd iterations where the nearest-centre step is replaced by assign(), so
+    territories stay compact without ever going over their capacity. Costs
+    O(n k) per iteration.
+    """
+    caps = np.asarray(caps, dtype=np.int64)
+    if caps.sum() != len(lats):
+        raise ValueError(f"capacities add up to {caps.sum()}, not to the {len(lats)} points")
+    if len(lats) == 0:
+        return np.empty(0, dtype=np.int64)
+    xy = project_km(lats, lons)
+    centers = _seed(xy, len(caps), np.random.default_rng(seed))
+    labels = None
+    for _ in range(max_iterations):
+        new = assign(_sq_dist(xy, centers), caps)
+        if labels is not None and np.array_equal(new, labels):
+            break
+        labels = new
+        for c in range(len(caps)):
+            if caps[c]:
+                centers[c] = xy[labels == c].mean(axis=0)
+    return labels
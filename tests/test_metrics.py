@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from geo import DEFAULT_CELL_DEG, GridIndex, haversine_km
+from metrics import CELL_DEG, METRIC_COLUMNS, PipelineMetrics, count_leads
+from schema import STATUS_OPTIONS, SYSTEM_OPTIONS, VENDOR_OPTIONS
+
+CENTER = (-34.60, -58.44)
+
+
+def _leads(n=4000, seed=7):
+    """Leads around CENTER, a third of them snapped onto grid-cell edges (both grids), some without coordinates."""
+    rng = np.random.default_rng(seed)
+    lats = CENTER[0] + rng.uniform(-0.05, 0.05, n)
+    lons = CENTER[1] + rng.uniform(-0.05, 0.05, n)
+    edge = rng.random(n) < 0.33
+    step = np.where(rng.random(n) < 0.5, CELL_DEG, DEFAULT_CELL_DEG)
+    lats[edge] = np.round(lats[edge] / step[edge]) * step[edge]
+    lons[edge] = np.round(lons[edge] / step[edge]) * step[edge]
+    lats[rng.random(n) < 0.05] = np.nan
+    return pd.DataFrame({
+        "Status": pd.Categorical(rng.choice(STATUS_OPTIONS, n), categories=STATUS_OPTIONS),
+        "Asignado_A": rng.choice(VENDOR_OPTIONS, n),
+        "Sistema": rng.choice(SYSTEM_OPTIONS, n),
+        "latitude": lats.astype(np.float32),
+        "longitude": lons.astype(np.float32),
+    }, index=pd.RangeIndex(1, n + 1, name="lead_id"))
+
+
+def _as_dict(counts):
+    return {tuple(row[:-1]): row[-1] for row in counts[METRIC_COLUMNS + ["n"]].itertuples(index=False)}
+
+
+def _brute(df):
+    return {key: int(n) for key, n in df[METRIC_COLUMNS].astype(str).value_counts().items()}
+
+
+@pytest.mark.parametrize("radius_km", [0.1, 0.22, 0.5, 1.0, 1.11, 2.0, 3.7])
+def test_zone_counts_match_brute_force(radius_km):
+    df = _leads()
+    lats = df["latitude"].to_numpy(dtype=float)
+    lons = df["longitude"].to_numpy(dtype=float)
+    # Centres on a cell corner, on a cell edge and inside a cell
+    for center in (CENTER, (CENTER[0] + CELL_DEG / 2, CENTER[1]), (CENTER[0] + 0.0013, CENTER[1] - 0.0071)):
+        zone = GridIndex(lats, lons).radius_mask(center[0], center[1], radius_km)
+        inside = haversine_km(center[0], center[1], lats, lons) <= radius_km
+        assert (zone == inside).all()
+        assert _as_dict(count_leads(df[zone])) == _brute(df[inside])
+
+
+def test_totals_follow_edits():
+    df = _leads(500)
+    metrics = PipelineMetrics.from_frame(df)
+    assert _as_dict(metrics.counts()) == _brute(df)
+
+    moved = {"Status": "Cliente", "Asignado_A": VENDOR_OPTIONS[1], "Sistema": SYSTEM_OPTIONS[0],
+             "latitude": CENTER[0], "longitude": CENTER[1]}
+    for lead_id in df.index[:50]:
+        metrics.remove(df.loc[lead_id].to_dict())
+        df.loc[lead_id, list(moved)] = list(moved.values())
+        metrics.add(df.loc[lead_id].to_dict())
+    assert _as_dict(metrics.counts()) == _brute(df)
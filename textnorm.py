@@ -0,0 +1,58 @@
+"""Text normalization shared by search and ingest."""
+import re
+import unicodedata
+
+# Lead bytes of UTF-8 sequences as they look after being decoded as latin1 ("Ã³" for "ó")
+_MOJIBAKE_MARKERS = ("Ã", "Â", "â")
+# Anything clean_text_series would change
+_ODD_SPACES = "\u00a0\u202f"     # no-break spaces Maps puts around times ("7\u202fp.m.")
+_UNCLEAN_RE = "|".join(_MOJIBAKE_MARKERS) + f"|[{_ODD_SPACES}]" + r"|\s\s|^[\s·]|[\s·]$"
+
+
+def repair_mojibake(text):
+    """Undo a UTF-8 -> latin1 double decode ("HipÃ³lito" -> "Hipólito"); other text is returned as is."""
+    if not isinstance(text, str) or not any(m in text for m in _MOJIBAKE_MARKERS):
+        return text
+    try:
+        return text.encode("latin1").decode("utf-8")
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return text
+
+
+def fold(text):
+    """Lowercase, accent-free, alphanumeric-only form for matching ("Hipólito" == "HIPOLITO")."""
+    if not isinstance(text, str):
+        return ""
+    text = unicodedata.normalize("NFKD", repair_mojibake(text)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def fold_series(values):
+    """fold() over a whole Series with vectorized string ops; mojibake is only repaired where present."""
+    text = values.astype(object).where(values.notna(), "").astype(str)
+    garbled = text.str.contains("|".join(_MOJIBAKE_MARKERS), regex=True).to_numpy()
+    if garbled.any():
+        text[garbled] = text[garbled].map(repair_mojibake)
+    text = text.str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii").str.lower()
+    return text.str.replace(r"[^a-z0-9]+", " ", regex=True).str.strip()
+
+
+def clean_text_series(values):
+    """Display form of scraped text, vectorized: mojibake repaired, odd spaces made plain, the
+    scraper's leading/trailing "·" separators trimmed. Returns the cleaned values and a mask
+    of the ones that changed; missing values stay missing."""
+    text = values.astype(object).where(values.notna(), "").astype(str)
+    dirty = text.str.contains(_UNCLEAN_RE, regex=True).to_numpy() & values.notna().to_numpy()
+    if not dirty.any():
+        return values, dirty
+    fixed = text[dirty]
+    garbled = fixed.str.contains("|".join(_MOJIBAKE_MARKERS), regex=True).to_numpy()
+    fixed[garbled] = fixed[garbled].map(repair_mojibake)
+    fixed = fixed.str.replace(f"[{_ODD_SPACES}\\s]+", " ", regex=True).str.strip(" ·")
+    out = values.astype(object).copy()
+    out[dirty] = fixed
+    return out, dirty
+
+
+def tokens(text):
+    return fold(text).split()
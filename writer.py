@@ -0,0 +1,126 @@
+"""Write-behind persistence: storage writes run on a background thread, bursts coalesced into one batch."""
+import logging
+import threading
+import time
+
+COALESCE_S = 0.25        # how long a burst of edits is gathered before it is written
+RETRY_S = 2.0            # wait after a failed batch before retrying its writes one by one
+FLUSH_TIMEOUT_S = 10.0
+
+log = logging.getLogger(__name__)
+
+
+class WriteBehind:
+    """Queue of storage writes drained by one worker thread.
+
+    submit() returns immediately. The worker waits COALESCE_S after the first
+    queued write, then hands everything queued so far to run_batch(ops) as one
+    batch (one transaction, or one file rewrite).
+
+    A failed batch is retried once, after RETRY_S, one write at a time, so a
+    single bad write can't hold back the rest. Writes that fail again are set
+    aside in dead_letters (op, error) for the UI to show, and can be queued
+    again with retry_failed() or dropped with discard_failed(). While a batch is failing, flush() doesn't wait
+    for it.
+    """
+
+    def __init__(self, run_batch, delay=COALESCE_S):
+        self._run_batch = run_batch
+        self.delay = delay
+        self._ops = []              # in submission order
+        self._in_flight = 0
+        self._urgent = False
+        self._closed = False
+        self._failing = False
+        self._cond = threading.Condition()
+        self.dead_letters = []
+        self._thread = threading.Thread(target=self._loop, name="crm-write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, op):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("write-behind queue is closed")
+            self._ops.append(op)
+            self._cond.notify_all()
+
+    def pending(self):
+        """Writes queued or being written right now."""
+        with self._cond:
+            return len(self._ops) + self._in_flight
+
+    def flush(self, timeout=FLUSH_TIMEOUT_S):
+        """Writes everything queued now instead of after the coalescing delay; True once drained.
+
+        Returns False straight away while a failed batch is waiting to be retried."""
+        with self._cond:
+            if threading.current_thread() is self._thread:
+                return not self._ops
+            self._urgent = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: (not self._ops and not self._in_flight) or self._failing, timeout)
+            return not self._ops and not self._in_flight
+
+    def retry_failed(self):
+        """Queues the dead-lettered writes again, ahead of anything queued since."""
+        with self._cond:
+            self._ops[:0] = [op for op, _ in self.dead_letters]
+            self.dead_letters = []
+            self._cond.notify_all()
+
+    def discard_failed(self):
+        """Forgets the dead-lettered writes, for ones that can never succeed."""
+        with self._cond:
+            self.dead_letters = []
+
+    def close(self, timeout=30.0):
+        """Flushes and stops the worker; registered with atexit so a shutdown doesn't drop edits."""
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        # The worker drains the queue (a failing batch's retry included) before it exits
+        self._thread.join(timeout)
+        lost = self.pending() + len(self.dead_letters)
+        if lost:
+            log.error("write-behind: %d writes not saved at shutdown", lost)
+        return not lost
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._ops or self._closed)
+                if not self._ops:
+                    return
+                if not self._urgent and not self._closed:
+                    self._cond.wait_for(lambda: self._urgent or self._closed, self.delay)
+                batch = self._ops
+                self._ops = []
+                self._in_flight = len(batch)
+                self._urgent = False
+            try:
+                self._run_batch(batch)
+                failed = []
+            except Exception as e:
+                log.warning("write-behind: batch of %d writes failed (%s); retrying them one by one", len(batch), e)
+                with self._cond:
+                    self._failing = True
+                    self._cond.notify_all()
+                time.sleep(RETRY_S)
+                failed = self._run_each(batch)
+            with self._cond:
+                self.dead_letters.extend(failed)
+                self._in_flight = 0
+                self._failing = False
+                self._cond.notify_all()
+
+    def _run_each(self, batch):
+        """[(op, error)] of the batch's writes that fail when run on their own."""
+        failed = []
+        for op in batch:
+            try:
+                self._run_batch([op])
+            except Exception as e:
+                log.exception("write-behind: giving up on a write")
+                failed.append((op, e))
+        return failed